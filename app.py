@@ -1,33 +1,14 @@
-from flask import Flask, render_template, request, jsonify, session
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for
 from flask_redis import FlaskRedis
-from config.config import Config
+from config.config import Config, config
 from models.models import db
-from services.biometric_service import BiometricService
-from services.facial_recognition import FacialRecognition
-from services.voice_recognition import VoiceRecognition
 from controllers.auth_controller import auth_bp
-from utils.cache_manager import cache
+from utils.cache_manager import cache, CacheManager
 from utils.db_utils import init_db
+from utils.session_interface import RedisSessionInterface
+from utils import request_profiler
 import logging
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Initialize extensions
-db.init_app(app)
-redis_client = FlaskRedis(app)
-cache.init_app(app)
-
-# Initialize services
-facial_recognition = FacialRecognition()
-voice_recognition = VoiceRecognition()
-biometric_service = BiometricService(facial_recognition, voice_recognition)
-
-# Register blueprints
-app.register_blueprint(auth_bp)
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -35,42 +16,97 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.before_first_request
-def setup():
-    """Initialize database and cache on first request"""
-    init_db(app)
-    cache.clear()
-    logger.info("Application initialized successfully")
-
-@app.route('/')
-def index():
-    """Render main authentication page"""
-    return render_template('auth.html')
-
-@app.route('/dashboard')
-def dashboard():
-    """Render dashboard for authenticated users"""
-    if 'user_id' not in session:
-        return redirect(url_for('index'))
-    return render_template('dashboard.html')
-
-@app.route('/health')
-def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy'})
-
-@app.errorhandler(404)
-def not_found_error(error):
-    """Handle 404 errors"""
-    return jsonify({'error': 'Resource not found'}), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    """Handle 500 errors"""
-    db.session.rollback()
-    return jsonify({'error': 'Internal server error'}), 500
+
+def create_app(config_name: str = None, warm: bool = False) -> Flask:
+    """
+    Create and configure the Flask application
+
+    Recognition models and their dependencies (cv2, dlib, scipy, ...) are
+    not imported here; services are built on first use or by warm_up().
+
+    Args:
+        config_name: Key into config.config.config; defaults to Config
+        warm: Run warm_up() before returning, e.g. ahead of a pre-fork server
+    """
+    # Initialize Flask app
+    app = Flask(__name__)
+    app.config.from_object(config[config_name] if config_name else Config)
+
+    # Initialize extensions
+    db.init_app(app)
+    FlaskRedis(app)
+    cache.init_app(app)
+
+    # Server-side sessions; deferred Redis writes are flushed with the
+    # session, or here if the request ended before the session was saved
+    app.session_interface = RedisSessionInterface()
+    app.teardown_request(lambda exc: CacheManager().flush_deferred())
+
+    # Opt-in request profiling; installs no hooks unless enabled in Config
+    request_profiler.init_app(app)
+
+    # Register blueprints
+    app.register_blueprint(auth_bp)
+
+    @app.before_first_request
+    def setup():
+        """Initialize database and cache on first request"""
+        init_db(app)
+        cache.clear()
+        logger.info("Application initialized successfully")
+
+    @app.route('/')
+    def index():
+        """Render main authentication page"""
+        return render_template('auth.html')
+
+    @app.route('/dashboard')
+    def dashboard():
+        """Render dashboard for authenticated users"""
+        if 'user_id' not in session:
+            return redirect(url_for('index'))
+        return render_template('dashboard.html')
+
+    @app.route('/health')
+    def health_check():
+        """Health check endpoint"""
+        return jsonify({'status': 'healthy'})
+
+    @app.errorhandler(404)
+    def not_found_error(error):
+        """Handle 404 errors"""
+        return jsonify({'error': 'Resource not found'}), 404
+
+    @app.errorhandler(500)
+    def internal_error(error):
+        """Handle 500 errors"""
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+    if warm or app.config.get('PRELOAD_SERVICES'):
+        warm_up(app)
+
+    return app
+
+
+def warm_up(app: Flask) -> None:
+    """
+    Import heavy dependencies and build the biometric services
+
+    Call this in the master process before forking workers (for example
+    ``gunicorn --preload 'app:create_app(warm=True)'``) so model weights
+    are loaded once and shared copy-on-write, and the first request does
+    not pay for imports and model loading.
+    """
+    from controllers.auth_controller import get_biometric_service
+
+    with app.app_context():
+        get_biometric_service()
+    logger.info("Biometric services warmed up")
+
 
 if __name__ == '__main__':
+    app = create_app()
     app.run(
         host=Config.HOST,
         port=Config.PORT,
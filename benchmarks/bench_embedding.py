@@ -0,0 +1,94 @@
+"""Compare face embedding backends on CPU: per-face latency and batched throughput.
+
+Usage:
+    python benchmarks/bench_embedding.py IMAGE_DIR [--onnx-model models/face_embedding.onnx]
+
+Detects and aligns one face per image in IMAGE_DIR (requires the dlib
+model files under models/), then times each backend embedding faces one
+call at a time and in batches of increasing size. ``--threads`` sets the
+intra-op threads of the ONNX backend; dlib runs its own CPU code paths.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Config  # noqa: E402
+from services.face_embedding import DlibEmbeddingBackend, OnnxEmbeddingBackend  # noqa: E402
+from services.facial_recognition import FacialRecognition  # noqa: E402
+
+
+def load_faces(recognizer: FacialRecognition, image_dir: str, limit: int):
+    faces = []
+    for name in sorted(os.listdir(image_dir)):
+        with open(os.path.join(image_dir, name), 'rb') as f:
+            data = f.read()
+        try:
+            image, gray = recognizer.load_image(data)
+        except ValueError:
+            continue
+        face = recognizer.detect_face(image, gray)
+        if face is None:
+            continue
+        faces.append((image, recognizer.shape_predictor(image, face)))
+        if len(faces) >= limit:
+            break
+    return faces
+
+
+def bench(backend, faces, batch_sizes, repeat: int) -> dict:
+    crops = [backend.align(image, shape) for image, shape in faces]
+    backend.embed_batch(crops[:1])  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for crop in crops:
+            backend.embed_batch([crop])
+    single_ms = 1000 * (time.perf_counter() - start) / (repeat * len(crops))
+
+    throughput = {}
+    for size in batch_sizes:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for i in range(0, len(crops), size):
+                backend.embed_batch(crops[i:i + size])
+        throughput[size] = repeat * len(crops) / (time.perf_counter() - start)
+    return {'single_ms': single_ms, 'throughput': throughput}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('image_dir')
+    parser.add_argument('--onnx-model', default=Config.FACE_ONNX_MODEL)
+    parser.add_argument('--threads', type=int, default=Config.FACE_EMBEDDING_THREADS)
+    parser.add_argument('--faces', type=int, default=64)
+    parser.add_argument('--batch-sizes', default='1,8,32')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    batch_sizes = [int(x) for x in args.batch_sizes.split(',')]
+    backends = [DlibEmbeddingBackend()]
+    if os.path.isfile(args.onnx_model):
+        backends.append(OnnxEmbeddingBackend(args.onnx_model, threads=args.threads))
+    else:
+        print(f"{args.onnx_model} not found, benchmarking dlib only")
+
+    recognizer = FacialRecognition(backends[0])
+    faces = load_faces(recognizer, args.image_dir, args.faces)
+    if not faces:
+        print("No faces detected")
+        return
+    print(f"{len(faces)} faces, {args.threads} ONNX threads, {os.cpu_count()} cores")
+
+    print(f"{'backend':<10}{'dim':>6}{'per face ms':>14}" + ''.join(f"{f'batch {b} f/s':>16}" for b in batch_sizes))
+    for backend in backends:
+        result = bench(backend, faces, batch_sizes, args.repeat)
+        dim = backend.embed_batch([backend.align(*faces[0])]).shape[1]
+        print(f"{backend.name:<10}{dim:>6}{result['single_ms']:>14.2f}"
+              + ''.join(f"{result['throughput'][b]:>16.1f}" for b in batch_sizes))
+
+
+if __name__ == '__main__':
+    main()
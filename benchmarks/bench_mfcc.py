@@ -0,0 +1,80 @@
+"""Compare MFCCExtractor against python_speech_features.mfcc.
+
+Usage:
+    python benchmarks/bench_mfcc.py [--utterances 32] [--seconds 3]
+
+Checks that both produce the same features within tolerance and reports
+per-utterance latency for the reference, the extractor, and the batched
+extractor.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.voice_features import MFCCExtractor  # noqa: E402
+
+
+def synthetic_utterances(count: int, seconds: float, sample_rate: int):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    utterances = []
+    for _ in range(count):
+        f0 = rng.uniform(90, 250)
+        voiced = sum(np.sin(2 * np.pi * f0 * h * t) / h for h in range(1, 8))
+        noise = rng.normal(0, 0.02, len(t))
+        length = int(len(t) * rng.uniform(0.6, 1.0))
+        utterances.append((0.1 * voiced + noise)[:length].astype(np.float32))
+    return utterances
+
+
+def timed(fn, repeats: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--utterances', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    args = parser.parse_args()
+
+    from python_speech_features import mfcc
+
+    utterances = synthetic_utterances(args.utterances, args.seconds, args.sample_rate)
+    extractor = MFCCExtractor(sample_rate=args.sample_rate, n_mfcc=13, n_filters=26, n_fft=1024)
+
+    def reference():
+        return [mfcc(a, samplerate=args.sample_rate, numcep=13, nfilt=26, nfft=1024)
+                for a in utterances]
+
+    expected = reference()
+    single = [extractor.extract(a) for a in utterances]
+    batched = extractor.extract_batch(utterances)
+
+    max_error = max(np.abs(e - s).max() for e, s in zip(expected, single))
+    batch_error = max(np.abs(e - b).max() for e, b in zip(expected, batched))
+    print(f"max abs difference: single={max_error:.2e} batched={batch_error:.2e}")
+    assert all(np.allclose(e, s, rtol=1e-4, atol=1e-4) for e, s in zip(expected, single))
+    assert all(np.allclose(e, b, rtol=1e-4, atol=1e-4) for e, b in zip(expected, batched))
+
+    n = len(utterances)
+    t_ref = timed(reference) / n
+    t_single = timed(lambda: [extractor.extract(a) for a in utterances]) / n
+    t_batch = timed(lambda: extractor.extract_batch(utterances)) / n
+    print(f"python_speech_features: {t_ref * 1000:.3f} ms/utterance")
+    print(f"MFCCExtractor.extract:  {t_single * 1000:.3f} ms/utterance ({t_ref / t_single:.1f}x)")
+    print(f"MFCCExtractor.batch:    {t_batch * 1000:.3f} ms/utterance ({t_ref / t_batch:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Measure latency and peak RSS of face image decoding on large inputs.
+
+Usage:
+    python benchmarks/bench_preprocessing.py [--image photo.jpg] [--iterations 20]
+
+Each mode runs in its own subprocess so the peak RSS figures are not
+polluted by the other mode. ``baseline`` decodes at full resolution and
+converts the full frame to grayscale, as the service did before the
+preprocessing stage; ``fast`` uses ImagePreprocessor.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_test_image(path: str, width: int = 4032, height: int = 3024) -> None:
+    """Write a large synthetic phone-sized JPEG"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    image = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+
+def run_mode(mode: str, image_path: str, iterations: int) -> dict:
+    import cv2
+    import numpy as np
+    from services.image_preprocessing import ImagePreprocessor
+
+    with open(image_path, 'rb') as f:
+        data = f.read()
+
+    preprocessor = ImagePreprocessor()
+    latencies = []
+    shape = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        if mode == 'baseline':
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            image, gray = preprocessor.prepare(data)
+        latencies.append(time.perf_counter() - start)
+        shape = gray.shape
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'working_shape': list(shape),
+        'median_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        # ru_maxrss is reported in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--image', help="JPEG to benchmark; a 12MP synthetic image is used by default")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--mode', choices=('baseline', 'fast'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.image, args.iterations)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = args.image
+        if image_path is None:
+            image_path = os.path.join(tmp, 'large.jpg')
+            make_test_image(image_path)
+
+        results = []
+        for mode in ('baseline', 'fast'):
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__), '--mode', mode,
+                '--image', image_path, '--iterations', str(args.iterations)
+            ])
+            results.append(json.loads(output))
+
+    print(f"{'mode':<10}{'shape':>14}{'median ms':>12}{'p95 ms':>10}{'peak RSS MB':>14}")
+    for r in results:
+        shape = 'x'.join(str(v) for v in r['working_shape'])
+        print(f"{r['mode']:<10}{shape:>14}{r['median_ms']:>12}{r['p95_ms']:>10}{r['peak_rss_mb']:>14}")
+
+    baseline, fast = results
+    print(f"latency reduction: {baseline['median_ms'] / max(fast['median_ms'], 1e-6):.1f}x, "
+          f"peak RSS saved: {baseline['peak_rss_mb'] - fast['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
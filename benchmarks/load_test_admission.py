@@ -0,0 +1,108 @@
+"""Load test the admission controller under increasing overload.
+
+Usage:
+    python benchmarks/load_test_admission.py [--slots 4] [--duration 10]
+
+Open-loop clients arrive at a multiple of the service capacity with the
+request mix of a login storm. Each request occupies a worker slot for its
+service time (emulated with sleep) and counts towards goodput only if it
+finishes before its deadline. The baseline is a plain FIFO semaphore with
+the same number of slots; the controlled run uses AdmissionController.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.admission_control import AdmissionController, EndpointPolicy  # noqa: E402
+
+# endpoint: (share of arrivals, service time s, deadline s)
+MIX = {
+    'authenticate': (0.8, 0.20, 2.0),
+    'update_biometrics': (0.1, 0.40, 5.0),
+    'register': (0.1, 0.60, 10.0),
+}
+
+
+def capacity(slots: int) -> float:
+    """Requests per second the slots can serve for this mix"""
+    mean_service = sum(share * service for share, service, _ in MIX.values())
+    return slots / mean_service
+
+
+def run(load: float, slots: int, duration: float, controlled: bool) -> Counter:
+    results = Counter()
+    lock = threading.Lock()
+    rate = load * capacity(slots)
+    rng = random.Random(42)
+
+    semaphore = threading.BoundedSemaphore(slots)
+    controller = AdmissionController(slots, {
+        'authenticate': EndpointPolicy('authenticate', 0, slots, MIX['authenticate'][2], 0.2),
+        'update_biometrics': EndpointPolicy('update_biometrics', 1, max(1, slots // 4),
+                                            MIX['update_biometrics'][2], 0.4),
+        'register': EndpointPolicy('register', 2, max(1, slots // 4), MIX['register'][2], 0.6),
+    })
+
+    def client(endpoint: str, service: float, deadline: float) -> None:
+        start = time.monotonic()
+        if controlled:
+            admitted, _ = controller.acquire(endpoint, start + deadline)
+            if not admitted:
+                with lock:
+                    results['shed'] += 1
+                return
+            time.sleep(service)
+            controller.release(endpoint, service)
+        else:
+            with semaphore:
+                time.sleep(service)
+        on_time = time.monotonic() - start <= deadline
+        with lock:
+            results['good' if on_time else 'late'] += 1
+            if on_time and endpoint == 'authenticate':
+                results['good_authenticate'] += 1
+
+    threads = []
+    end = time.monotonic() + duration
+    endpoints = list(MIX)
+    weights = [MIX[e][0] for e in endpoints]
+    while time.monotonic() < end:
+        endpoint = rng.choices(endpoints, weights)[0]
+        _, service, deadline = MIX[endpoint]
+        thread = threading.Thread(target=client, args=(endpoint, service, deadline), daemon=True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(rng.expovariate(rate))
+    for thread in threads:
+        thread.join()
+
+    results['offered'] = len(threads)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slots', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--loads', default='0.5,1.0,1.5,2.0,3.0',
+                        help="Comma-separated multiples of capacity")
+    args = parser.parse_args()
+
+    print(f"capacity: {capacity(args.slots):.1f} req/s with {args.slots} slots")
+    print(f"{'load':>6}{'mode':>12}{'offered':>10}{'goodput/s':>12}{'auth ok/s':>12}{'late':>8}{'shed':>8}")
+    for load in (float(x) for x in args.loads.split(',')):
+        for controlled in (False, True):
+            r = run(load, args.slots, args.duration, controlled)
+            print(f"{load:>6.1f}{'admission' if controlled else 'fifo':>12}{r['offered']:>10}"
+                  f"{r['good'] / args.duration:>12.1f}{r['good_authenticate'] / args.duration:>12.1f}"
+                  f"{r['late']:>8}{r['shed']:>8}")
+
+
+if __name__ == '__main__':
+    main()
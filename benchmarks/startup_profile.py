@@ -0,0 +1,92 @@
+"""Report application start-up cost from ``python -X importtime``.
+
+Usage:
+    python benchmarks/startup_profile.py [--top 15] [--warm] [--json out.json]
+
+Imports ``app`` and calls ``create_app()`` in a fresh interpreter, then
+prints the total import time, wall time, and the slowest top-level
+packages. With ``--warm`` the time spent in ``warm_up()`` is reported
+separately. ``--json`` writes the numbers so they can be tracked over time.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+_PROBE = """
+import time
+start = time.perf_counter()
+import app
+app_module = app
+application = app_module.create_app()
+created = time.perf_counter()
+warm = 0.0
+if {warm}:
+    app_module.warm_up(application)
+    warm = time.perf_counter() - created
+print('STARTUP', created - start, warm)
+"""
+
+
+def profile(warm: bool) -> dict:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE.format(warm=warm)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    packages = defaultdict(int)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        total_us += int(self_us)
+        # Top-level imports have the smallest indent; attribute their
+        # cumulative time to the root package
+        if len(indent) == 1:
+            packages[module.split('.')[0]] += int(cumulative_us)
+
+    startup_line = next(l for l in result.stdout.splitlines() if l.startswith('STARTUP'))
+    _, create_s, warm_s = startup_line.split()
+    return {
+        'import_time_ms': round(total_us / 1000, 1),
+        'create_app_wall_ms': round(float(create_s) * 1000, 1),
+        'warm_up_wall_ms': round(float(warm_s) * 1000, 1),
+        'packages_ms': {name: round(us / 1000, 1) for name, us in
+                        sorted(packages.items(), key=lambda item: -item[1])},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--warm', action='store_true', help="Also time warm_up()")
+    parser.add_argument('--json', help="Write the report to this file")
+    args = parser.parse_args()
+
+    report = profile(args.warm)
+    print(f"total import time:   {report['import_time_ms']:.1f} ms")
+    print(f"import + create_app: {report['create_app_wall_ms']:.1f} ms")
+    if args.warm:
+        print(f"warm_up:             {report['warm_up_wall_ms']:.1f} ms")
+    print("slowest top-level imports:")
+    for name, ms in list(report['packages_ms'].items())[:args.top]:
+        print(f"  {name:<30}{ms:>10.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
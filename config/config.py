@@ -1,5 +1,5 @@
 import os
-from dotenv import load_load_dotenv
+from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
@@ -23,20 +23,102 @@ class Config:
     FACE_DETECTION_CONFIDENCE = float(os.getenv('FACE_DETECTION_CONFIDENCE', '0.8'))
     FACE_MATCHING_THRESHOLD = float(os.getenv('FACE_MATCHING_THRESHOLD', '0.6'))
     REQUIRED_FACE_FEATURES = int(os.getenv('REQUIRED_FACE_FEATURES', '68'))
+
+    # Face embedding backend: dlib (default) or onnx (OpenCV DNN on CPU)
+    FACE_EMBEDDING_BACKEND = os.getenv('FACE_EMBEDDING_BACKEND', 'dlib')
+    FACE_EMBEDDING_THREADS = int(os.getenv('FACE_EMBEDDING_THREADS', str(os.cpu_count() or 1)))
+    FACE_EMBEDDING_BATCH_SIZE = int(os.getenv('FACE_EMBEDDING_BATCH_SIZE', '32'))
+    FACE_ONNX_MODEL = os.getenv('FACE_ONNX_MODEL', 'models/face_embedding.onnx')
+    FACE_ONNX_INPUT_SIZE = int(os.getenv('FACE_ONNX_INPUT_SIZE', '112'))
+    FACE_ONNX_MEAN = float(os.getenv('FACE_ONNX_MEAN', '127.5'))
+    FACE_ONNX_SCALE = float(os.getenv('FACE_ONNX_SCALE', str(1 / 127.5)))
+    FACE_ONNX_MATCH_THRESHOLD = float(os.getenv('FACE_ONNX_MATCH_THRESHOLD', '1.1'))  # on unit vectors
+    FACE_ONNX_TEMPLATE_VERSION = os.getenv('FACE_ONNX_TEMPLATE_VERSION', 'onnx-v1')  # at most 10 characters
+
+    # Face quality gate, evaluated before descriptor extraction
+    FACE_MIN_SIZE = int(os.getenv('FACE_MIN_SIZE', '80'))  # pixels
+    FACE_BLUR_THRESHOLD = float(os.getenv('FACE_BLUR_THRESHOLD', '50.0'))  # Laplacian variance
+    FACE_MIN_BRIGHTNESS = float(os.getenv('FACE_MIN_BRIGHTNESS', '50.0'))
+    FACE_MAX_BRIGHTNESS = float(os.getenv('FACE_MAX_BRIGHTNESS', '210.0'))
+    FACE_MAX_CLIPPED_FRACTION = float(os.getenv('FACE_MAX_CLIPPED_FRACTION', '0.25'))
+    FACE_MAX_ROLL = float(os.getenv('FACE_MAX_ROLL', '20.0'))  # degrees
+    FACE_MAX_YAW_ASYMMETRY = float(os.getenv('FACE_MAX_YAW_ASYMMETRY', '0.3'))
+
+    # Image preprocessing limits
+    MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+    MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', str(50 * 1000 * 1000)))
+    FACE_IMAGE_MAX_SIDE = int(os.getenv('FACE_IMAGE_MAX_SIDE', '1024'))
     
     # Voice recognition settings
     VOICE_SAMPLE_RATE = int(os.getenv('VOICE_SAMPLE_RATE', '16000'))
     VOICE_MATCHING_THRESHOLD = float(os.getenv('VOICE_MATCHING_THRESHOLD', '0.75'))
+
+    # Voice activity detection applied before MFCC extraction
+    VOICE_VAD_ENABLED = os.getenv('VOICE_VAD_ENABLED', 'True').lower() == 'true'
+    VOICE_VAD_MIN_RMS = float(os.getenv('VOICE_VAD_MIN_RMS', '0.01'))
+    VOICE_VAD_RELATIVE_THRESHOLD = float(os.getenv('VOICE_VAD_RELATIVE_THRESHOLD', '0.1'))
+    VOICE_VAD_ZCR_THRESHOLD = float(os.getenv('VOICE_VAD_ZCR_THRESHOLD', '0.25'))
+    VOICE_VAD_HANGOVER_FRAMES = int(os.getenv('VOICE_VAD_HANGOVER_FRAMES', '5'))
     
     # Security settings
     MAX_LOGIN_ATTEMPTS = int(os.getenv('MAX_LOGIN_ATTEMPTS', '3'))
     LOCKOUT_DURATION = int(os.getenv('LOCKOUT_DURATION', '300'))  # seconds
     SESSION_TIMEOUT = int(os.getenv('SESSION_TIMEOUT', '1800'))  # seconds
+    SESSION_REFRESH_THRESHOLD = int(os.getenv('SESSION_REFRESH_THRESHOLD', '180'))  # seconds
+    TOKEN_EXPIRY_HOURS = int(os.getenv('TOKEN_EXPIRY_HOURS', '24'))
+    TOKEN_STATUS_CACHE_TTL = float(os.getenv('TOKEN_STATUS_CACHE_TTL', '5'))  # seconds
     
+    # Admission control for biometric endpoints
+    ADMISSION_TOTAL_SLOTS = int(os.getenv('ADMISSION_TOTAL_SLOTS', str(os.cpu_count() or 1)))
+    ADMISSION_LIMIT_AUTHENTICATE = int(os.getenv('ADMISSION_LIMIT_AUTHENTICATE', str(os.cpu_count() or 1)))
+    ADMISSION_LIMIT_UPDATE = int(os.getenv('ADMISSION_LIMIT_UPDATE', '2'))
+    ADMISSION_LIMIT_REGISTER = int(os.getenv('ADMISSION_LIMIT_REGISTER', '2'))
+    ADMISSION_DEADLINE_AUTHENTICATE = float(os.getenv('ADMISSION_DEADLINE_AUTHENTICATE', '5'))  # seconds
+    ADMISSION_DEADLINE_UPDATE = float(os.getenv('ADMISSION_DEADLINE_UPDATE', '15'))  # seconds
+    ADMISSION_DEADLINE_REGISTER = float(os.getenv('ADMISSION_DEADLINE_REGISTER', '30'))  # seconds
+
+    # Admin endpoints require this value in the X-Admin-Token header; empty disables them
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+    # Per-request profiling, triggered by admins (X-Profile header) or by sampling
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0.0'))  # fraction of requests
+    PROFILING_MODE = os.getenv('PROFILING_MODE', 'sampling')  # sampling | cprofile
+    PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', '0.005'))  # seconds between samples
+    PROFILING_RETENTION = int(os.getenv('PROFILING_RETENTION', '86400'))  # seconds
+
+    # Authentication statistics rollups
+    AUTH_STATS_COMPACTION_INTERVAL = int(os.getenv('AUTH_STATS_COMPACTION_INTERVAL', '60'))  # seconds; 0 disables
+    AUTH_STATS_MINUTE_RETENTION_DAYS = int(os.getenv('AUTH_STATS_MINUTE_RETENTION_DAYS', '7'))
+    AUTH_STATS_HOUR_RETENTION_DAYS = int(os.getenv('AUTH_STATS_HOUR_RETENTION_DAYS', '400'))
+    AUTH_STATS_USER_RETENTION_DAYS = int(os.getenv('AUTH_STATS_USER_RETENTION_DAYS', '90'))  # per-user hourly rows
+    AUTH_STATS_MAX_BUCKETS = int(os.getenv('AUTH_STATS_MAX_BUCKETS', '1440'))  # per dashboard query
+
+    # Sharded face search (comma-separated host:port list of search workers)
+    FACE_SEARCH_SHARDS = os.getenv('FACE_SEARCH_SHARDS', '')
+    FACE_SEARCH_TIMEOUT = float(os.getenv('FACE_SEARCH_TIMEOUT', '0.5'))  # seconds per shard
+    FACE_SEARCH_VNODES = int(os.getenv('FACE_SEARCH_VNODES', '64'))
+    FACE_SEARCH_CONNECT_TIMEOUT = float(os.getenv('FACE_SEARCH_CONNECT_TIMEOUT', '1.0'))  # seconds
+    FACE_SEARCH_SHARD_THREADS = int(os.getenv('FACE_SEARCH_SHARD_THREADS', '8'))  # coordinator threads per shard
+    # Authenticates coordinator/worker connections, which carry pickled data; required with FACE_SEARCH_SHARDS
+    FACE_SEARCH_AUTHKEY = os.getenv('FACE_SEARCH_AUTHKEY', '')
+
     # Biometric template storage
     TEMPLATE_STORAGE_PATH = os.getenv('TEMPLATE_STORAGE_PATH', 'storage/biometric_templates')
     MAX_TEMPLATE_SIZE = int(os.getenv('MAX_TEMPLATE_SIZE', '50000'))  # bytes
+    FACE_TEMPLATE_DIM = int(os.getenv('FACE_TEMPLATE_DIM', '128'))
+    TEMPLATE_STORE_ENABLED = os.getenv('TEMPLATE_STORE_ENABLED', 'False').lower() == 'true'
+    TEMPLATE_STORE_DTYPE = os.getenv('TEMPLATE_STORE_DTYPE', 'float32')  # float32 or float16
+    TEMPLATE_COMPACTION_INTERVAL = int(os.getenv('TEMPLATE_COMPACTION_INTERVAL', '300'))  # seconds
+    TEMPLATE_COMPACTION_MIN_DEAD_RATIO = float(os.getenv('TEMPLATE_COMPACTION_MIN_DEAD_RATIO', '0.2'))
+
+    # Bulk enrollment settings
+    BULK_ENROLL_WORKERS = int(os.getenv('BULK_ENROLL_WORKERS', str(os.cpu_count() or 1)))
+    BULK_ENROLL_BATCH_SIZE = int(os.getenv('BULK_ENROLL_BATCH_SIZE', '500'))
+    BULK_ENROLL_CHECKPOINT = os.getenv('BULK_ENROLL_CHECKPOINT', 'storage/bulk_enroll.checkpoint')
     
+    # Load models and build services in the master process before workers fork
+    PRELOAD_SERVICES = os.getenv('PRELOAD_SERVICES', 'False').lower() == 'true'
+
     # Logging configuration
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'logs/biometric_auth.log')
@@ -1,18 +1,42 @@
-from flask import Blueprint, request, jsonify, session
-from datetime import datetime, timedelta
-import jwt
+from flask import Blueprint, Response, request, jsonify, session
 from functools import wraps
-from redis import Redis
+import threading
 
 from models.models import User, BiometricData, db
-from services.biometric_service import BiometricService
+from utils.admission_control import admission_controlled, get_admission_controller
+from utils.auth_stats import get_auth_stats
+from utils.auth_tokens import CurrentUser, TokenManager, is_admin_request
 from utils.cache_manager import CacheManager
-from config.config import Config
 
 auth_bp = Blueprint('auth', __name__)
-redis_client = Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT)
-cache = CacheManager(redis_client)
-biometric_service = BiometricService()
+
+# Built on first use (or by app.warm_up) so importing the controller does
+# not load recognition models or open connections
+_cache = None
+_biometric_service = None
+_biometric_service_lock = threading.Lock()
+
+def get_cache() -> CacheManager:
+    global _cache
+    if _cache is None:
+        _cache = CacheManager()
+    return _cache
+
+def get_biometric_service():
+    """Return the shared BiometricService, importing its dependencies on first call"""
+    global _biometric_service
+    if _biometric_service is None:
+        # Concurrent first requests must not each load the models
+        with _biometric_service_lock:
+            if _biometric_service is None:
+                from services.biometric_service import BiometricService
+                _biometric_service = BiometricService()
+    return _biometric_service
+
+def publish_template(user_id, face_template):
+    """Append a committed face template to the shared template store, if enabled"""
+    from utils.template_store import publish_template as publish
+    publish(user_id, face_template)
 
 def token_required(f):
     @wraps(f)
@@ -20,12 +44,19 @@ def token_required(f):
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({'message': 'Token is missing'}), 401
-        try:
-            data = jwt.decode(token, Config.SECRET_KEY, algorithms=["HS256"])
-            current_user = User.query.get(data['user_id'])
-        except:
-            return jsonify({'message': 'Token is invalid'}), 401
-        return f(current_user, *args, **kwargs)
+        claims, error = TokenManager().validate(token)
+        if claims is None:
+            return jsonify({'message': error}), 401
+        # The User row is only loaded if the handler reads more than the claims
+        return f(CurrentUser(claims), *args, **kwargs)
+    return decorated
+
+def admin_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not is_admin_request(request.headers):
+            return jsonify({'message': 'Admin token required'}), 403
+        return f(*args, **kwargs)
     return decorated
 
 def rate_limit(key_prefix, limit=5, period=300):
@@ -33,21 +64,19 @@ def rate_limit(key_prefix, limit=5, period=300):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             key = f"{key_prefix}:{request.remote_addr}"
-            current = cache.get(key)
+            # Counted before the view runs so parallel requests see each other
+            count = get_cache().hit(key, period)
             
-            if current is not None and int(current) >= limit:
+            if count is not None and count > limit:
                 return jsonify({'message': 'Rate limit exceeded'}), 429
                 
-            cache.incr(key)
-            if current is None:
-                cache.expire(key, period)
-                
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
 @auth_bp.route('/register', methods=['POST'])
 @rate_limit('register')
+@admission_controlled('register')
 def register():
     data = request.get_json()
     
@@ -64,11 +93,13 @@ def register():
         
         biometric_data = BiometricData(
             user_id=new_user.id,
-            face_template=biometric_service.process_face_data(data['face_data']),
-            voice_template=biometric_service.process_voice_data(data['voice_data'])
+            face_template=get_biometric_service().process_face_data(data['face_data']),
+            voice_template=get_biometric_service().process_voice_data(data['voice_data']),
+            template_version=get_biometric_service().facial_recognition.template_version
         )
         db.session.add(biometric_data)
         db.session.commit()
+        publish_template(new_user.id, biometric_data.face_template)
         
         return jsonify({'message': 'User registered successfully'}), 201
         
@@ -78,27 +109,31 @@ def register():
 
 @auth_bp.route('/authenticate', methods=['POST'])
 @rate_limit('authenticate')
+@admission_controlled('authenticate')
 def authenticate():
     data = request.get_json()
     
     if not all(k in data for k in ('username', 'biometric_data')):
         return jsonify({'message': 'Missing required fields'}), 400
         
+    # Only the face sample is handed to verify_user below
+    auth_type = 'face'
+    stats = get_auth_stats()
+
     user = User.query.filter_by(username=data['username']).first()
     if not user:
+        stats.record(auth_type, False, 'User not found')
         return jsonify({'message': 'User not found'}), 404
         
     try:
-        auth_result = biometric_service.verify_user(
+        auth_result = get_biometric_service().verify_user(
             user.id,
             data['biometric_data']
         )
+        stats.record(auth_type, auth_result['success'], auth_result.get('reason'), user_id=user.id)
         
         if auth_result['success']:
-            token = jwt.encode({
-                'user_id': user.id,
-                'exp': datetime.utcnow() + timedelta(hours=24)
-            }, Config.SECRET_KEY, algorithm="HS256")
+            token = TokenManager().issue(user)
             
             session['user_id'] = user.id
             
@@ -113,17 +148,20 @@ def authenticate():
             }), 401
             
     except Exception as e:
+        stats.record(auth_type, False, 'Internal error', user_id=user.id)
         return jsonify({'message': f'Authentication error: {str(e)}'}), 500
 
 @auth_bp.route('/logout', methods=['POST'])
 @token_required
 def logout(current_user):
+    TokenManager().revoke(current_user.claims)
     session.pop('user_id', None)
     return jsonify({'message': 'Logged out successfully'}), 200
 
 @auth_bp.route('/update-biometrics', methods=['PUT'])
 @token_required
 @rate_limit('update_biometrics')
+@admission_controlled('update_biometrics')
 def update_biometrics(current_user):
     data = request.get_json()
     
@@ -134,14 +172,56 @@ def update_biometrics(current_user):
         biometric_data = BiometricData.query.filter_by(user_id=current_user.id).first()
         
         if 'face_data' in data:
-            biometric_data.face_template = biometric_service.process_face_data(data['face_data'])
+            biometric_data.face_template = get_biometric_service().process_face_data(data['face_data'])
+            biometric_data.template_version = get_biometric_service().facial_recognition.template_version
             
         if 'voice_data' in data:
-            biometric_data.voice_template = biometric_service.process_voice_data(data['voice_data'])
+            biometric_data.voice_template = get_biometric_service().process_voice_data(data['voice_data'])
             
         db.session.commit()
+        if 'face_data' in data:
+            publish_template(current_user.id, biometric_data.face_template)
         return jsonify({'message': 'Biometric data updated successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Update failed: {str(e)}'}), 500
+
+@auth_bp.route('/admin/admission-stats', methods=['GET'])
+@admin_required
+def admission_stats():
+    return jsonify(get_admission_controller().stats()), 200
+
+@auth_bp.route('/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    profiles = [{'request_id': request_id, 'captured_at': captured_at}
+                for request_id, captured_at in get_cache().list_profiles(limit)]
+    return jsonify({'profiles': profiles}), 200
+
+@auth_bp.route('/admin/profiles/<request_id>', methods=['GET'])
+@admin_required
+def get_profile(request_id):
+    profile = get_cache().get_profile(request_id)
+    if profile is None:
+        return jsonify({'message': 'Profile not found'}), 404
+    # Plain collapsed stacks for flamegraph.pl / speedscope
+    if request.args.get('format') == 'collapsed':
+        return Response('\n'.join(profile['collapsed']) + '\n', mimetype='text/plain')
+    return jsonify(profile), 200
+
+@auth_bp.route('/admin/auth-stats', methods=['GET'])
+@admin_required
+def auth_stats():
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ('minute', 'hour'):
+        return jsonify({'message': 'granularity must be minute or hour'}), 400
+    buckets = request.args.get('buckets', 60 if granularity == 'minute' else 24, type=int)
+    return jsonify(get_auth_stats().query(granularity, buckets)), 200
+
+@auth_bp.route('/admin/auth-stats/users/<int:user_id>', methods=['GET'])
+@admin_required
+def user_auth_stats(user_id):
+    hours = request.args.get('hours', 24, type=int)
+    return jsonify(get_auth_stats().user_activity(user_id, hours)), 200
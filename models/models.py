@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Binary, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Binary, Boolean, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -51,6 +51,42 @@ class AuthenticationLog(Base):
     # Relationships
     user = relationship("User", back_populates="auth_logs")
 
+class AuthStatsRollup(Base):
+    """Authentication counts per time bucket, compacted from Redis counters"""
+    __tablename__ = 'auth_stats_rollups'
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String(6), nullable=False)  # minute or hour
+    bucket_start = Column(DateTime, nullable=False)
+    auth_type = Column(String(20), nullable=False)
+    success = Column(Boolean, nullable=False)
+    failure_reason = Column(String(100), nullable=False, default='')
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('granularity', 'bucket_start', 'auth_type', 'success', 'failure_reason',
+                         name='uq_auth_stats_bucket'),
+        Index('ix_auth_stats_granularity_bucket', 'granularity', 'bucket_start'),
+    )
+
+class AuthUserActivity(Base):
+    """Hourly authentication counts per user, compacted from Redis counters"""
+    __tablename__ = 'auth_user_activity'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    auth_type = Column(String(20), nullable=False)
+    success = Column(Boolean, nullable=False)
+    failure_reason = Column(String(100), nullable=False, default='')
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'bucket_start', 'auth_type', 'success', 'failure_reason',
+                         name='uq_auth_user_activity_bucket'),
+        Index('ix_auth_user_activity_bucket', 'bucket_start'),
+    )
+
 class SecuritySettings(Base):
     __tablename__ = 'security_settings'
 
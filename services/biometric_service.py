@@ -1,13 +1,14 @@
 from typing import Dict, Optional, Tuple
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from ..models.models import User, BiometricData
 from .facial_recognition import FacialRecognitionService
 from .voice_recognition import VoiceRecognitionService
 from ..utils.cache_manager import CacheManager
 from ..utils.db_utils import get_db_session
-from ..config.config import BiometricConfig
+from ..utils.auth_tokens import TokenManager
+from ..config.config import BiometricConfig, Config
 
 logger = logging.getLogger(__name__)
 
@@ -42,7 +43,8 @@ class BiometricService:
 
             # Facial recognition check
             face_match = await self.facial_recognition.verify_face(
-                face_data, biometric_data.facial_data)
+                face_data, biometric_data.facial_data,
+                template_version=biometric_data.template_version)
             if not face_match:
                 self._record_failed_attempt(user_id)
                 return False, "Face verification failed"
@@ -75,9 +77,9 @@ class BiometricService:
             db = get_db_session()
             
             # Validate face data quality
-            face_quality = await self.facial_recognition.check_quality(face_data)
-            if not face_quality:
-                return False, "Face image quality insufficient"
+            face_quality = self.facial_recognition.check_quality(face_data)
+            if not face_quality['passed']:
+                return False, f"Face image quality insufficient: {face_quality['reason']}"
 
             # Process and store biometric data
             facial_template = await self.facial_recognition.create_template(face_data)
@@ -121,8 +123,14 @@ class BiometricService:
         self.cache.set_failed_attempts(user_id, current_attempts + 1)
         logger.warning(f"Failed authentication attempt for user {user_id}")
 
+        # Lock out existing tokens as well as new logins
+        if current_attempts + 1 >= self.config.MAX_FAILED_ATTEMPTS:
+            TokenManager().lock_user(
+                user_id, datetime.utcnow() + timedelta(seconds=Config.LOCKOUT_DURATION))
+
     def _record_successful_auth(self, user_id: int) -> None:
         """Record successful authentication"""
         self.cache.clear_failed_attempts(user_id)
         self.cache.set_last_success(user_id, datetime.utcnow())
+        TokenManager().unlock_user(user_id)
         logger.info(f"Successful authentication for user {user_id}")
@@ -0,0 +1,424 @@
+"""Offline bulk enrollment and re-enrollment pipeline.
+
+Usage:
+    python -m services.bulk_enrollment --manifest users.csv
+    python -m services.bulk_enrollment --directory /data/enroll --reenroll --backend onnx
+
+A manifest is a CSV file with ``username,face_path,voice_path`` columns
+(``voice_path`` may be empty). A directory contains one sub-directory per
+username holding ``face.jpg``/``face.png`` and an optional ``voice.wav``.
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam
+
+from config.config import Config
+from models.models import User, BiometricData
+from utils.db_utils import DatabaseManager
+from utils.template_store import TemplateStore
+
+logger = logging.getLogger(__name__)
+
+Sample = Tuple[str, str, Optional[str]]
+EncodedSample = Tuple[str, Optional[bytes], Optional[bytes], Optional[str]]
+
+FACE_FILENAMES = ('face.jpg', 'face.jpeg', 'face.png')
+VOICE_FILENAMES = ('voice.wav',)
+
+# Per-process recognizers, built once by _init_worker
+_facial_recognition = None
+_voice_recognition = None
+
+
+def iter_manifest(manifest_path: str) -> Iterator[Sample]:
+    """Stream samples from a CSV manifest, resolving paths relative to it"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline='') as f:
+        for row in csv.DictReader(f):
+            username = (row.get('username') or '').strip()
+            face_path = (row.get('face_path') or '').strip()
+            if not username or not face_path:
+                continue
+            voice_path = (row.get('voice_path') or '').strip() or None
+            yield (
+                username,
+                os.path.join(base_dir, face_path),
+                os.path.join(base_dir, voice_path) if voice_path else None
+            )
+
+
+def iter_directory(root: str) -> Iterator[Sample]:
+    """Stream samples from a directory with one sub-directory per username"""
+    with os.scandir(root) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            if not entry.is_dir():
+                continue
+            face_path = _first_existing(entry.path, FACE_FILENAMES)
+            if face_path is None:
+                logger.warning(f"No face image for {entry.name}, skipping")
+                continue
+            yield entry.name, face_path, _first_existing(entry.path, VOICE_FILENAMES)
+
+
+def _first_existing(directory: str, names: Tuple[str, ...]) -> Optional[str]:
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _init_worker(backend: str, threads: int) -> None:
+    """Load the recognition models once per worker process"""
+    global _facial_recognition, _voice_recognition
+    from services.face_embedding import create_backend
+    from services.facial_recognition import FacialRecognition
+    from services.voice_recognition import VoiceRecognitionService
+
+    kwargs = {'threads': threads} if backend == 'onnx' else {}
+    _facial_recognition = FacialRecognition(create_backend(backend, **kwargs))
+    _voice_recognition = VoiceRecognitionService()
+
+
+def _prepare_sample(sample: Sample) -> Tuple[Optional[np.ndarray], Optional[bytes], Optional[str]]:
+    """Detect, check and align the face and build the voice template"""
+    _, face_path, voice_path = sample
+    with open(face_path, 'rb') as f:
+        image, gray = _facial_recognition.load_image(f.read())
+
+    face = _facial_recognition.detect_face(image, gray)
+    if face is None:
+        return None, None, "No face detected"
+
+    # One landmark pass serves the pose check and the alignment
+    shape = _facial_recognition.shape_predictor(image, face)
+    landmarks = np.array([[p.x, p.y] for p in shape.parts()])
+    quality = _facial_recognition.check_quality(image, face, gray, landmarks)
+    if not quality['passed']:
+        return None, None, f"Face quality check failed: {quality['reason']}"
+
+    crop = _facial_recognition.embedding_backend.align(image, shape)
+
+    voice_template = None
+    if voice_path:
+        voice_template = _voice_recognition.create_template(voice_path)
+        if voice_template is None:
+            return None, None, "Failed to extract voice features"
+        if len(voice_template) > Config.MAX_TEMPLATE_SIZE:
+            return None, None, "Voice template too large"
+
+    return crop, voice_template, None
+
+
+def _encode_chunk(samples: List[Sample]) -> List[EncodedSample]:
+    """
+    Encode a chunk of users' samples; runs inside a worker process
+
+    Faces are aligned one by one and then embedded in a single backend
+    batch, which lets batched backends amortise each forward pass.
+    """
+    prepared = []
+    for sample in samples:
+        try:
+            prepared.append(_prepare_sample(sample))
+        except Exception as e:
+            prepared.append((None, None, str(e)))
+
+    crops = [crop for crop, _, error in prepared if error is None]
+    try:
+        encodings = iter(_facial_recognition.embedding_backend.embed_batch(crops))
+    except Exception as e:
+        return [(sample[0], None, None, error or f"Failed to extract face features: {str(e)}")
+                for sample, (_, _, error) in zip(samples, prepared)]
+
+    results = []
+    for sample, (_, voice_template, error) in zip(samples, prepared):
+        if error is not None:
+            results.append((sample[0], None, None, error))
+        else:
+            face_template = np.asarray(next(encodings), dtype=np.float32).tobytes()
+            results.append((sample[0], face_template, voice_template, None))
+    return results
+
+
+class Checkpoint:
+    """Append-only record of usernames whose templates are committed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+
+    def __contains__(self, username: str) -> bool:
+        return username in self.done
+
+    def mark(self, usernames: Iterable[str]) -> None:
+        """Persist usernames after their batch has been committed"""
+        usernames = list(usernames)
+        if not usernames:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(''.join(f"{name}\n" for name in usernames))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(usernames)
+
+
+class BulkEnrollmentPipeline:
+    def __init__(self, template_version: Optional[str] = None,
+                 reenroll: bool = False,
+                 workers: int = Config.BULK_ENROLL_WORKERS,
+                 batch_size: int = Config.BULK_ENROLL_BATCH_SIZE,
+                 checkpoint_path: str = Config.BULK_ENROLL_CHECKPOINT,
+                 use_copy: bool = False,
+                 template_store=None,
+                 backend: str = Config.FACE_EMBEDDING_BACKEND,
+                 embedding_batch_size: int = Config.FACE_EMBEDDING_BATCH_SIZE):
+        from services.face_embedding import EMBEDDING_BACKENDS, TEMPLATE_VERSION_MAX_LENGTH
+
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown face embedding backend '{backend}'")
+        # Defaults to the tag of the backend producing the templates; any
+        # other tag must be one the backend verifies, or the templates
+        # written could never be matched
+        template_version = template_version or EMBEDDING_BACKENDS[backend].template_version
+        if not EMBEDDING_BACKENDS[backend].accepts(template_version):
+            raise ValueError(f"Backend '{backend}' cannot verify templates tagged '{template_version}'")
+        if len(template_version) > TEMPLATE_VERSION_MAX_LENGTH:
+            raise ValueError(f"Template version '{template_version}' is longer than "
+                             f"{TEMPLATE_VERSION_MAX_LENGTH} characters")
+        self.template_version = template_version
+        self.backend = backend
+        self.reenroll = reenroll
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.embedding_batch_size = max(1, embedding_batch_size)
+        # Split cores between worker processes and the backend's own threads
+        self.backend_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self.use_copy = use_copy
+        self.template_store = template_store
+        # One checkpoint per template version so a re-enrollment run
+        # does not skip users finished by an earlier enrollment run
+        self.checkpoint = Checkpoint(f"{checkpoint_path}.{template_version}")
+        self.db = DatabaseManager()
+        self.stats = {'processed': 0, 'enrolled': 0, 'updated': 0,
+                      'skipped': 0, 'failed': 0}
+
+    def run(self, samples: Iterable[Sample]) -> Dict[str, float]:
+        """
+        Encode samples on a process pool and write templates in batches
+
+        Encoding of the next batch overlaps with the database write of
+        the previous one. Progress is checkpointed after every commit so
+        an interrupted run resumes where it stopped.
+
+        Returns:
+            Dict[str, float]: Counters and overall throughput
+        """
+        start = time.perf_counter()
+        pending = self._filter_done(samples)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.backend, self.backend_threads)) as pool:
+            in_flight = None
+            while True:
+                batch = list(islice(pending, self.batch_size))
+                step = self.embedding_batch_size
+                futures = [pool.submit(_encode_chunk, batch[i:i + step])
+                           for i in range(0, len(batch), step)] if batch else None
+                if in_flight:
+                    self._write_batch([r for f in in_flight for r in f.result()])
+                    self._report_progress(start)
+                if not futures:
+                    break
+                in_flight = futures
+
+        elapsed = time.perf_counter() - start
+        summary = dict(self.stats)
+        summary['elapsed_seconds'] = round(elapsed, 3)
+        summary['samples_per_second'] = round(self.stats['processed'] / elapsed, 2) if elapsed else 0.0
+        logger.info(f"Bulk enrollment finished: {summary}")
+        return summary
+
+    def _filter_done(self, samples: Iterable[Sample]) -> Iterator[Sample]:
+        for sample in samples:
+            if sample[0] in self.checkpoint:
+                self.stats['skipped'] += 1
+                continue
+            yield sample
+
+    def _write_batch(self, results: List[EncodedSample]) -> None:
+        """Write one batch of encoded templates in a single transaction"""
+        self.stats['processed'] += len(results)
+        encoded = {}
+        for username, face_template, voice_template, error in results:
+            if error:
+                self.stats['failed'] += 1
+                logger.warning(f"Enrollment failed for {username}: {error}")
+            else:
+                encoded[username] = (face_template, voice_template)
+        if not encoded:
+            return
+
+        now = datetime.utcnow()
+        table = BiometricData.__table__
+
+        with self.db.get_session() as session:
+            user_ids = dict(session.query(User.username, User.id)
+                            .filter(User.username.in_(list(encoded))).all())
+            for username in encoded.keys() - user_ids.keys():
+                self.stats['failed'] += 1
+                logger.warning(f"Enrollment failed for {username}: User not found")
+
+            existing = dict(session.query(BiometricData.user_id, BiometricData.id)
+                            .filter(BiometricData.user_id.in_(list(user_ids.values())),
+                                    BiometricData.is_primary.is_(True)).all())
+
+            inserts, updates = [], []
+            for username, user_id in user_ids.items():
+                face_template, voice_template = encoded[username]
+                if user_id in existing:
+                    if not self.reenroll:
+                        self.stats['skipped'] += 1
+                        continue
+                    updates.append({
+                        'b_id': existing[user_id],
+                        'b_face': face_template,
+                        'b_voice': voice_template,
+                        'b_updated': now,
+                        'b_version': self.template_version
+                    })
+                else:
+                    inserts.append({
+                        'user_id': user_id,
+                        'face_template': face_template,
+                        'voice_template': voice_template,
+                        'last_updated': now,
+                        'template_version': self.template_version,
+                        'is_primary': True
+                    })
+
+            if inserts:
+                if self.use_copy and session.bind.dialect.name == 'postgresql':
+                    self._copy_rows(session, inserts)
+                else:
+                    session.execute(table.insert(), inserts)
+            if updates:
+                session.execute(
+                    table.update()
+                    .where(table.c.id == bindparam('b_id'))
+                    .values(face_template=bindparam('b_face'),
+                            voice_template=bindparam('b_voice'),
+                            last_updated=bindparam('b_updated'),
+                            template_version=bindparam('b_version')),
+                    updates
+                )
+
+        self.stats['enrolled'] += len(inserts)
+        self.stats['updated'] += len(updates)
+
+        if self.template_store is not None:
+            written = [(user_id, encoded[username][0]) for username, user_id in user_ids.items()
+                       if self.reenroll or user_id not in existing]
+            if written:
+                self.template_store.append(
+                    [user_id for user_id, _ in written],
+                    np.vstack([np.frombuffer(t, dtype=np.float32) for _, t in written])
+                )
+
+        self.checkpoint.mark(user_ids.keys())
+
+    @staticmethod
+    def _copy_rows(session, rows: List[dict]) -> None:
+        """Stream new rows through PostgreSQL COPY on the session's connection"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                row['user_id'],
+                '\\x' + row['face_template'].hex(),
+                '\\x' + row['voice_template'].hex() if row['voice_template'] else None,
+                row['last_updated'].isoformat(),
+                row['template_version'],
+                't'
+            ])
+        buffer.seek(0)
+
+        cursor = session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                "COPY biometric_data (user_id, face_template, voice_template, "
+                "last_updated, template_version, is_primary) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+    def _report_progress(self, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        rate = self.stats['processed'] / elapsed if elapsed else 0.0
+        logger.info(
+            f"Processed {self.stats['processed']} samples "
+            f"({self.stats['enrolled']} enrolled, {self.stats['updated']} updated, "
+            f"{self.stats['skipped']} skipped, {self.stats['failed']} failed) "
+            f"at {rate:.1f} samples/s"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk biometric enrollment")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help="CSV manifest with username,face_path,voice_path")
+    source.add_argument('--directory', help="Directory with one sub-directory per user")
+    parser.add_argument('--backend', default=Config.FACE_EMBEDDING_BACKEND,
+                        help="Face embedding backend (dlib or onnx)")
+    parser.add_argument('--template-version',
+                        help="Tag stored with the templates; defaults to the backend's, "
+                             "otherwise one of its legacy tags")
+    parser.add_argument('--reenroll', action='store_true',
+                        help="Replace existing templates with ones from this run")
+    parser.add_argument('--workers', type=int, default=Config.BULK_ENROLL_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=Config.BULK_ENROLL_BATCH_SIZE)
+    parser.add_argument('--checkpoint', default=Config.BULK_ENROLL_CHECKPOINT)
+    parser.add_argument('--copy', action='store_true',
+                        help="Insert new templates with PostgreSQL COPY")
+    parser.add_argument('--template-store', action='store_true',
+                        help="Also append face templates to the memory-mapped template store")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    samples = iter_manifest(args.manifest) if args.manifest else iter_directory(args.directory)
+    pipeline = BulkEnrollmentPipeline(
+        template_version=args.template_version,
+        reenroll=args.reenroll,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+        use_copy=args.copy,
+        template_store=TemplateStore() if args.template_store else None,
+        backend=args.backend
+    )
+    summary = pipeline.run(samples)
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import logging
+import os
+from typing import Dict, Sequence, Type
+
+import cv2
+import dlib
+import numpy as np
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# ArcFace reference positions of the eye centres, nose tip and mouth
+# corners in a 112x112 crop
+ARCFACE_REFERENCE = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], dtype=np.float32)
+
+# Tag of templates written before backends were pluggable, all by dlib.
+# Rows with no tag at all are from the same era and are read as this.
+LEGACY_TEMPLATE_VERSION = 'v1'
+# Width of BiometricData.template_version
+TEMPLATE_VERSION_MAX_LENGTH = 10
+
+
+class EmbeddingBackend:
+    """
+    Face embedding model
+
+    Backends turn aligned face crops into fixed-length descriptors.
+    ``template_version`` is stored with every template so descriptors from
+    different models are never compared with each other.
+    """
+    name = ''
+    template_version = ''
+    dim = 0
+    match_threshold = Config.FACE_MATCHING_THRESHOLD
+    # Older tags for templates this backend can still verify
+    legacy_versions = ()
+
+    @classmethod
+    def accepts(cls, template_version: str) -> bool:
+        """True if templates with this version tag are comparable with ours"""
+        return template_version == cls.template_version or template_version in cls.legacy_versions
+
+    def align(self, image: np.ndarray, shape: dlib.full_object_detection) -> np.ndarray:
+        """Crop and align one face using its 68-point landmarks"""
+        raise NotImplementedError
+
+    def embed_batch(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        Compute descriptors for aligned crops
+
+        Returns:
+            np.ndarray: (len(crops), dim) float32 matrix
+        """
+        raise NotImplementedError
+
+    def embed(self, image: np.ndarray, shape: dlib.full_object_detection) -> np.ndarray:
+        """Descriptor for a single face"""
+        return self.embed_batch([self.align(image, shape)])[0]
+
+
+class DlibEmbeddingBackend(EmbeddingBackend):
+    """dlib ResNet model producing 128-d descriptors (the original model)"""
+    name = 'dlib'
+    template_version = 'dlib-v1'
+    legacy_versions = (LEGACY_TEMPLATE_VERSION,)
+    dim = 128
+    CHIP_SIZE = 150
+    CHIP_PADDING = 0.25
+
+    def __init__(self, model_path: str = 'models/dlib_face_recognition_resnet_model_v1.dat'):
+        self.model = dlib.face_recognition_model_v1(model_path)
+
+    def align(self, image: np.ndarray, shape: dlib.full_object_detection) -> np.ndarray:
+        # Same chip compute_face_descriptor(image, shape) extracts internally
+        return dlib.get_face_chip(image, shape, size=self.CHIP_SIZE, padding=self.CHIP_PADDING)
+
+    def embed_batch(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        if not crops:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.array(self.model.compute_face_descriptor(list(crops)), dtype=np.float32)
+
+    def embed(self, image: np.ndarray, shape: dlib.full_object_detection) -> np.ndarray:
+        return np.array(self.model.compute_face_descriptor(image, shape), dtype=np.float32)
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """
+    ONNX embedding model (e.g. ArcFace) run by OpenCV's DNN module on CPU
+
+    Whole batches go through one forward pass and OpenCV spreads each
+    layer over ``threads`` cores. Descriptors are L2-normalised, so the
+    match threshold differs from dlib's.
+    """
+    name = 'onnx'
+    template_version = Config.FACE_ONNX_TEMPLATE_VERSION
+    match_threshold = Config.FACE_ONNX_MATCH_THRESHOLD
+
+    def __init__(self, model_path: str = Config.FACE_ONNX_MODEL,
+                 input_size: int = Config.FACE_ONNX_INPUT_SIZE,
+                 threads: int = Config.FACE_EMBEDDING_THREADS):
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"ONNX face model not found: {model_path}")
+        if not 0 < len(self.template_version) <= TEMPLATE_VERSION_MAX_LENGTH:
+            raise ValueError(f"FACE_ONNX_TEMPLATE_VERSION must be 1-{TEMPLATE_VERSION_MAX_LENGTH} "
+                             f"characters, got '{self.template_version}'")
+        cv2.setNumThreads(max(1, threads))
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.reference = ARCFACE_REFERENCE * (input_size / 112.0)
+        # Models exported with a fixed batch dimension of 1 reject larger
+        # blobs; detected on the first batch and then run face by face
+        self._batched = True
+        self.dim = int(self.embed_batch([np.zeros((input_size, input_size, 3), np.uint8)]).shape[1])
+
+    def align(self, image: np.ndarray, shape: dlib.full_object_detection) -> np.ndarray:
+        points = np.array([[p.x, p.y] for p in shape.parts()], dtype=np.float32)
+        source = np.array([
+            points[36:42].mean(axis=0),
+            points[42:48].mean(axis=0),
+            points[30],
+            points[48],
+            points[54],
+        ], dtype=np.float32)
+        matrix, _ = cv2.estimateAffinePartial2D(source, self.reference, method=cv2.LMEDS)
+        return cv2.warpAffine(image, matrix, (self.input_size, self.input_size), borderValue=0)
+
+    def _forward(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        blob = cv2.dnn.blobFromImages(list(crops), scalefactor=Config.FACE_ONNX_SCALE,
+                                      size=(self.input_size, self.input_size),
+                                      mean=(Config.FACE_ONNX_MEAN,) * 3, swapRB=True)
+        self.net.setInput(blob)
+        return self.net.forward().reshape(len(crops), -1)
+
+    def embed_batch(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        if not crops:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if self._batched and len(crops) > 1:
+            try:
+                output = self._forward(crops)
+            except cv2.error:
+                logger.info("ONNX face model has a fixed batch size; embedding faces one at a time")
+                self._batched = False
+        if not self._batched or len(crops) == 1:
+            output = np.concatenate([self._forward([crop]) for crop in crops])
+        output = output.astype(np.float32)
+        output /= np.maximum(np.linalg.norm(output, axis=1, keepdims=True), 1e-12)
+        return output
+
+
+EMBEDDING_BACKENDS: Dict[str, Type[EmbeddingBackend]] = {
+    DlibEmbeddingBackend.name: DlibEmbeddingBackend,
+    OnnxEmbeddingBackend.name: OnnxEmbeddingBackend,
+}
+
+
+def create_backend(name: str = Config.FACE_EMBEDDING_BACKEND, **kwargs) -> EmbeddingBackend:
+    """Build an embedding backend by name"""
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown face embedding backend '{name}', "
+                         f"expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[name](**kwargs)
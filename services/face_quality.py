@@ -0,0 +1,102 @@
+import cv2
+import numpy as np
+from typing import Any, Dict, Optional
+import logging
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Side length the face crop is resampled to before measuring blur and
+# exposure, so the cost and the thresholds do not depend on input size
+QUALITY_CROP_SIZE = 96
+
+
+class FaceQualityAssessor:
+    """
+    Cheap checks run on a detected face before descriptor extraction
+
+    Checks are ordered from cheapest to most expensive and stop at the
+    first failure. Each call returns a dict with ``passed``, a ``reason``
+    code (None when passed) and the ``metrics`` measured so far.
+    """
+
+    def __init__(self):
+        self.min_face_size = Config.FACE_MIN_SIZE
+        self.blur_threshold = Config.FACE_BLUR_THRESHOLD
+        self.min_brightness = Config.FACE_MIN_BRIGHTNESS
+        self.max_brightness = Config.FACE_MAX_BRIGHTNESS
+        self.max_clipped_fraction = Config.FACE_MAX_CLIPPED_FRACTION
+        self.max_roll = Config.FACE_MAX_ROLL
+        self.max_yaw_asymmetry = Config.FACE_MAX_YAW_ASYMMETRY
+
+    def assess(self, gray: np.ndarray, face, landmarks: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Assess face quality
+
+        Args:
+            gray: Grayscale image the face was detected in
+            face: dlib rectangle of the detected face
+            landmarks: Optional (68, 2) landmark array for the pose check
+
+        Returns:
+            Dict[str, Any]: {'passed': bool, 'reason': Optional[str], 'metrics': dict}
+        """
+        metrics = {}
+
+        # Face size
+        face_size = min(face.width(), face.height())
+        metrics['face_size'] = int(face_size)
+        if face_size < self.min_face_size:
+            return self._result('face_too_small', metrics)
+
+        height, width = gray.shape[:2]
+        top, bottom = max(face.top(), 0), min(face.bottom(), height)
+        left, right = max(face.left(), 0), min(face.right(), width)
+        if bottom - top < 2 or right - left < 2:
+            return self._result('face_out_of_frame', metrics)
+        crop = cv2.resize(gray[top:bottom, left:right], (QUALITY_CROP_SIZE, QUALITY_CROP_SIZE),
+                          interpolation=cv2.INTER_AREA)
+
+        # Exposure histogram
+        histogram = np.bincount(crop.ravel(), minlength=256)
+        total = crop.size
+        brightness = float(np.dot(histogram, np.arange(256)) / total)
+        clipped = float((histogram[:16].sum() + histogram[240:].sum()) / total)
+        metrics['brightness'] = round(brightness, 1)
+        metrics['clipped_fraction'] = round(clipped, 3)
+        if brightness < self.min_brightness:
+            return self._result('underexposed', metrics)
+        if brightness > self.max_brightness:
+            return self._result('overexposed', metrics)
+        if clipped > self.max_clipped_fraction:
+            return self._result('clipped_exposure', metrics)
+
+        # Blur via variance of the Laplacian
+        sharpness = float(cv2.Laplacian(crop, cv2.CV_64F).var())
+        metrics['sharpness'] = round(sharpness, 1)
+        if sharpness < self.blur_threshold:
+            return self._result('blurry', metrics)
+
+        # Pose from landmarks: roll from the eye line, yaw from how far the
+        # nose tip sits from the middle of the jaw line
+        if landmarks is not None:
+            left_eye = landmarks[36:42].mean(axis=0)
+            right_eye = landmarks[42:48].mean(axis=0)
+            dx, dy = right_eye - left_eye
+            roll = float(np.degrees(np.arctan2(dy, dx)))
+            jaw_left, jaw_right = landmarks[0][0], landmarks[16][0]
+            jaw_width = max(float(jaw_right - jaw_left), 1.0)
+            yaw_asymmetry = abs((landmarks[30][0] - jaw_left) / jaw_width - 0.5) * 2
+            metrics['roll'] = round(roll, 1)
+            metrics['yaw_asymmetry'] = round(float(yaw_asymmetry), 3)
+            if abs(roll) > self.max_roll:
+                return self._result('head_tilted', metrics)
+            if yaw_asymmetry > self.max_yaw_asymmetry:
+                return self._result('head_turned', metrics)
+
+        return {'passed': True, 'reason': None, 'metrics': metrics}
+
+    @staticmethod
+    def _result(reason: str, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        return {'passed': False, 'reason': reason, 'metrics': metrics}
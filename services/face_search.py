@@ -0,0 +1,530 @@
+"""Sharded scatter-gather face identification.
+
+Templates are partitioned across search worker processes by a consistent
+hash of the user id. The coordinator sends each probe to every shard,
+waits up to ``FACE_SEARCH_TIMEOUT`` for answers and merges the per-shard
+top-k; slow or dead shards yield a partial result instead of an error.
+Adding a shard only moves the users the hash ring assigns to it.
+
+Workers can run on other nodes; for local use and testing:
+
+    python -m services.face_search --shards 4 --templates 200000
+"""
+import argparse
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from multiprocessing.connection import (AuthenticationError, Connection, Listener, answer_challenge,
+                                        deliver_challenge)
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+Address = Tuple[str, int]
+# Calls a shard may have queued per thread before searches skip it
+MAX_PENDING_PER_THREAD = 4
+
+
+def parse_addresses(value: str) -> List[Address]:
+    """Parse a "host:port,host:port" list"""
+    addresses = []
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        host, port = item.rsplit(':', 1)
+        addresses.append((host, int(port)))
+    return addresses
+
+
+# ----------------------------------------------------------------------
+# Search worker
+# ----------------------------------------------------------------------
+
+class ShardIndex:
+    """In-memory templates for one shard"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.lock = threading.Lock()
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray) -> int:
+        with self.lock:
+            keep = ~np.isin(self.ids, ids)
+            self.ids = np.concatenate((self.ids[keep], ids))
+            self.vectors = np.concatenate((self.vectors[keep], vectors))
+            return len(self.ids)
+
+    def get(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the given users' templates"""
+        with self.lock:
+            mask = np.isin(self.ids, ids)
+            return self.ids[mask], self.vectors[mask]
+
+    def delete(self, ids: np.ndarray) -> int:
+        with self.lock:
+            keep = ~np.isin(self.ids, ids)
+            self.ids, self.vectors = self.ids[keep], self.vectors[keep]
+            return len(self.ids)
+
+    def search(self, probe: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        with self.lock:
+            ids, vectors = self.ids, self.vectors
+        if not len(ids):
+            return []
+        distances = np.linalg.norm(vectors - probe, axis=1)
+        if len(distances) > k:
+            top = np.argpartition(distances, k)[:k]
+        else:
+            top = np.arange(len(distances))
+        return [(float(distances[i]), int(ids[i])) for i in top]
+
+
+def _handle_connection(conn, index: ShardIndex) -> None:
+    with conn:
+        while True:
+            try:
+                op, *args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if op == 'search':
+                    result = index.search(*args)
+                elif op == 'upsert':
+                    result = index.upsert(*args)
+                elif op == 'get':
+                    result = index.get(*args)
+                elif op == 'delete':
+                    result = index.delete(*args)
+                elif op == 'ids':
+                    result = index.ids.copy()
+                elif op == 'count':
+                    result = len(index.ids)
+                else:
+                    raise ValueError(f"Unknown operation {op}")
+                conn.send(('ok', result))
+            except Exception as e:
+                conn.send(('error', str(e)))
+
+
+def serve_shard(address: Address, authkey: bytes,
+                dim: int = Config.FACE_TEMPLATE_DIM) -> None:
+    """Run a search worker; blocks forever"""
+    index = ShardIndex(dim)
+    with Listener(address, authkey=authkey) as listener:
+        logger.info(f"Face search shard listening on {address[0]}:{address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                logger.warning(f"Rejected face search connection: {str(e)}")
+                continue
+            threading.Thread(target=_handle_connection, args=(conn, index), daemon=True).start()
+
+
+def launch_local_shards(count: int, authkey: bytes, host: str = '127.0.0.1',
+                        base_port: int = 7600) -> Tuple[List[Address], List[multiprocessing.Process]]:
+    """Start search workers as local processes and wait until they accept connections"""
+    addresses = [(host, base_port + i) for i in range(count)]
+    processes = []
+    for address in addresses:
+        process = multiprocessing.Process(target=serve_shard, args=(address, authkey), daemon=True)
+        process.start()
+        processes.append(process)
+    for address in addresses:
+        _wait_for_shard(address, authkey)
+    return addresses, processes
+
+
+def _connect(address: Address, authkey: bytes, timeout: float) -> Connection:
+    """
+    Open an authenticated worker connection
+
+    Same handshake as multiprocessing.connection.Client, but connecting
+    and authenticating each give up after ``timeout`` seconds, so an
+    unreachable node cannot pin a coordinator thread.
+    """
+    sock = socket.create_connection(address, timeout=timeout)
+    with sock:
+        # Connection does blocking reads on the raw descriptor; bound the
+        # handshake with kernel socket timeouts instead
+        sock.setblocking(True)
+        limit = struct.pack('ll', int(timeout), int(timeout % 1 * 1e6))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, limit)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, limit)
+        conn = Connection(os.dup(sock.fileno()))
+        try:
+            answer_challenge(conn, authkey)
+            deliver_challenge(conn, authkey)
+        except BaseException:
+            conn.close()
+            raise
+        # Calls bound their own wait with poll(); bulk transfers must not time out
+        no_limit = struct.pack('ll', 0, 0)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, no_limit)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, no_limit)
+    return conn
+
+
+def _wait_for_shard(address: Address, authkey: bytes, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _connect(address, authkey, Config.FACE_SEARCH_CONNECT_TIMEOUT).close()
+            return
+        except (ConnectionRefusedError, OSError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+# ----------------------------------------------------------------------
+# Coordinator
+# ----------------------------------------------------------------------
+
+class ShardTimeout(Exception):
+    pass
+
+
+class ShardClient:
+    """
+    Pooled connections to one search worker
+
+    Asynchronous calls run on the shard's own ``threads``, so a slow or
+    unreachable shard only backs up its own queue, never calls to the
+    others; that queue is bounded and callers cancel what they stop
+    waiting for.
+    """
+
+    def __init__(self, address: Address, authkey: bytes,
+                 connect_timeout: float = Config.FACE_SEARCH_CONNECT_TIMEOUT,
+                 threads: int = Config.FACE_SEARCH_SHARD_THREADS):
+        self.address = address
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self.max_pending = MAX_PENDING_PER_THREAD * max(1, threads)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, threads),
+                                            thread_name_prefix=f"face-search-{address[1]}")
+
+    def submit(self, message: tuple, timeout: Optional[float] = None) -> Optional[Future]:
+        """Queue call() on the shard's threads, or return None if its queue is full"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+        future = self._executor.submit(self.call, message, timeout)
+        future.add_done_callback(self._call_done)
+        return future
+
+    def _call_done(self, _future: Future) -> None:
+        # Also runs when a queued call is cancelled
+        with self._lock:
+            self._pending -= 1
+
+    def call(self, message: tuple, timeout: Optional[float] = None):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = _connect(self.address, self.authkey, self.connect_timeout)
+        try:
+            conn.send(message)
+            if timeout is not None and not conn.poll(timeout):
+                # The reply may still arrive later; drop the connection so
+                # it cannot be mistaken for the answer to the next call
+                conn.close()
+                raise ShardTimeout(f"Shard {self.address} timed out")
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            raise
+        with self._lock:
+            self._idle.append(conn)
+        if status != 'ok':
+            raise RuntimeError(f"Shard {self.address} failed: {result}")
+        return result
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle = []
+
+
+class HashRing:
+    """Consistent hash ring mapping user ids to shard addresses"""
+
+    def __init__(self, addresses: Iterable[Address], vnodes: int = Config.FACE_SEARCH_VNODES):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[Address] = []
+        for address in addresses:
+            self.add(address)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def add(self, address: Address) -> None:
+        for vnode in range(self.vnodes):
+            point = self._hash(f"{address[0]}:{address[1]}#{vnode}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, address)
+
+    def copy(self) -> 'HashRing':
+        ring = HashRing((), self.vnodes)
+        ring._points, ring._owners = list(self._points), list(self._owners)
+        return ring
+
+    def remove(self, address: Address) -> None:
+        keep = [i for i, owner in enumerate(self._owners) if owner != address]
+        self._points = [self._points[i] for i in keep]
+        self._owners = [self._owners[i] for i in keep]
+
+    def owner(self, user_id: int) -> Address:
+        index = bisect.bisect(self._points, self._hash(str(user_id))) % len(self._points)
+        return self._owners[index]
+
+
+class ShardedFaceSearch:
+    """
+    Coordinator for a set of search workers
+
+    ``ring`` and ``clients`` are never mutated in place: resharding builds
+    new ones and swaps them in, so searches running concurrently keep
+    iterating a consistent snapshot. Loads and resharding are serialised
+    by ``_lock``.
+    """
+
+    def __init__(self, addresses: Sequence[Address], authkey: bytes,
+                 timeout: float = Config.FACE_SEARCH_TIMEOUT):
+        if not authkey:
+            raise ValueError("Face search workers require a non-empty authkey")
+        self.authkey = authkey
+        self.timeout = timeout
+        self.ring = HashRing(addresses)
+        self.clients: Dict[Address, ShardClient] = {a: ShardClient(a, authkey) for a in addresses}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(ring: HashRing, clients: Dict[Address, ShardClient],
+              user_ids: np.ndarray, templates: np.ndarray) -> None:
+        owners = [ring.owner(int(uid)) for uid in user_ids]
+        for address, client in clients.items():
+            mask = np.array([owner == address for owner in owners], dtype=bool)
+            if mask.any():
+                client.call(('upsert', user_ids[mask], templates[mask]))
+
+    def load(self, user_ids: Sequence[int], templates: np.ndarray) -> None:
+        """Partition templates by owner and upsert them into their shards"""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        templates = np.asarray(templates, dtype=np.float32)
+        with self._lock:
+            self._load(self.ring, self.clients, user_ids, templates)
+
+    def load_from_store(self, store) -> int:
+        """Load every live template from a TemplateStore"""
+        store.refresh()
+        total = 0
+        for user_ids, templates in store.iter_live():
+            self.load(user_ids, templates)
+            total += len(user_ids)
+        return total
+
+    def search(self, probe: np.ndarray, k: int = 5) -> dict:
+        """
+        Find the k nearest templates across all shards
+
+        Returns:
+            dict: {'matches': [(user_id, distance), ...], 'partial': bool,
+                   'missing_shards': ["host:port", ...]}
+        """
+        probe = np.asarray(probe, dtype=np.float32)
+        futures, missing = {}, []
+        for address, client in self.clients.items():
+            future = client.submit(('search', probe, k), self.timeout)
+            if future is None:
+                # The shard is not keeping up with earlier calls
+                logger.warning(f"Face search shard {address} is saturated, skipping it")
+                missing.append(address)
+            else:
+                futures[future] = address
+        done, not_done = wait(futures, timeout=self.timeout * 1.5)
+
+        candidates = []
+        for future in not_done:
+            future.cancel()
+            missing.append(futures[future])
+        for future in done:
+            try:
+                candidates.extend(future.result())
+            except Exception as e:
+                logger.warning(f"Face search shard {futures[future]} failed: {str(e)}")
+                missing.append(futures[future])
+
+        # While a shard is being added, a moving user is held by both its
+        # old and new owner
+        matches, seen = [], set()
+        for distance, user_id in sorted(candidates):
+            if user_id not in seen:
+                seen.add(user_id)
+                matches.append((user_id, distance))
+                if len(matches) == k:
+                    break
+        return {
+            'matches': matches,
+            'partial': bool(missing),
+            'missing_shards': [f"{host}:{port}" for host, port in missing],
+        }
+
+    def add_shard(self, address: Address) -> int:
+        """
+        Add a search worker and move the users it now owns onto it
+
+        Templates are copied to the new worker before the ring routes to
+        it and only then deleted from their old owners, so every user stays
+        searchable throughout.
+
+        Returns:
+            int: Number of templates moved
+        """
+        with self._lock:
+            if address in self.clients:
+                raise ValueError(f"Shard {address} is already registered")
+            client = ShardClient(address, self.authkey)
+            ring = self.ring.copy()
+            ring.add(address)
+            old_clients = self.clients
+            # Query the new shard as soon as templates start arriving
+            self.clients = {**old_clients, address: client}
+            copied = []
+            try:
+                for old_client in old_clients.values():
+                    ids = old_client.call(('ids',))
+                    moving = np.array([uid for uid in ids if ring.owner(int(uid)) == address],
+                                      dtype=np.int64)
+                    if not len(moving):
+                        continue
+                    moving_ids, vectors = old_client.call(('get', moving))
+                    client.call(('upsert', moving_ids, vectors))
+                    copied.append((old_client, moving_ids))
+            except Exception:
+                self.clients = old_clients
+                client.close()
+                raise
+            self.ring = ring
+
+            moved = 0
+            for old_client, moving_ids in copied:
+                try:
+                    old_client.call(('delete', moving_ids))
+                except Exception as e:
+                    # Stale copies only cost memory; search drops duplicates
+                    logger.warning(f"Failed to delete moved templates from {old_client.address}: {str(e)}")
+                moved += len(moving_ids)
+        logger.info(f"Added face search shard {address}, moved {moved} templates")
+        return moved
+
+    def remove_shard(self, address: Address) -> int:
+        """Drain a search worker, redistributing its templates to the others"""
+        with self._lock:
+            client = self.clients[address]
+            ring = self.ring.copy()
+            ring.remove(address)
+            clients = {a: c for a, c in self.clients.items() if a != address}
+            ids, vectors = client.call(('get', client.call(('ids',))))
+            self._load(ring, clients, ids, vectors)
+            # Its templates now live on their new owners
+            self.ring, self.clients = ring, clients
+        client.close()
+        return len(ids)
+
+    def close(self) -> None:
+        for client in self.clients.values():
+            client.close()
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_face_search() -> Optional[ShardedFaceSearch]:
+    """Process-wide coordinator for FACE_SEARCH_SHARDS, or None when unsharded"""
+    global _search
+    addresses = parse_addresses(Config.FACE_SEARCH_SHARDS)
+    if not addresses:
+        return None
+    if not Config.FACE_SEARCH_AUTHKEY:
+        raise ValueError("FACE_SEARCH_AUTHKEY must be set when FACE_SEARCH_SHARDS is configured")
+    if _search is None:
+        with _search_lock:
+            if _search is None:
+                _search = ShardedFaceSearch(addresses, Config.FACE_SEARCH_AUTHKEY.encode())
+    return _search
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a local sharded face search demo")
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--templates', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # The demo's workers are local children, so a throwaway key will do
+    authkey = Config.FACE_SEARCH_AUTHKEY.encode() or os.urandom(32)
+    addresses, processes = launch_local_shards(args.shards + 1, authkey)
+    search = ShardedFaceSearch(addresses[:-1], authkey)
+
+    rng = np.random.default_rng(0)
+    user_ids = np.arange(1, args.templates + 1)
+    templates = rng.normal(size=(args.templates, Config.FACE_TEMPLATE_DIM)).astype(np.float32)
+    search.load(user_ids, templates)
+
+    def check(label: str) -> bool:
+        latencies, exact = [], 0
+        for _ in range(args.queries):
+            probe = templates[rng.integers(len(templates))] + rng.normal(0, 0.05, templates.shape[1])
+            start = time.perf_counter()
+            result = search.search(probe, args.k)
+            latencies.append(time.perf_counter() - start)
+            expected = user_ids[np.argsort(np.linalg.norm(templates - probe.astype(np.float32), axis=1))[:args.k]]
+            exact += [uid for uid, _ in result['matches']] == expected.tolist()
+        print(f"{label}: {exact}/{args.queries} exact top-{args.k}, "
+              f"median {1000 * np.median(latencies):.1f} ms")
+        return exact == args.queries
+
+    ok = check(f"{args.shards} shards")
+    moved = search.add_shard(addresses[-1])
+    print(f"added shard, moved {moved} of {args.templates} templates")
+    ok = check(f"{args.shards + 1} shards") and ok
+
+    processes[0].terminate()
+    processes[0].join()
+    result = search.search(templates[0], args.k)
+    print(f"one shard down: partial={result['partial']} missing={result['missing_shards']}")
+
+    search.close()
+    for process in processes:
+        process.terminate()
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,23 @@
-import cv2
 import dlib
 import numpy as np
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Union
 import logging
 from datetime import datetime
 import os
 
+from services.face_embedding import LEGACY_TEMPLATE_VERSION, EmbeddingBackend, create_backend
+from services.face_quality import FaceQualityAssessor
+from services.image_preprocessing import ImagePreprocessor
+
 class FacialRecognition:
-    def __init__(self):
+    def __init__(self, embedding_backend: Optional[EmbeddingBackend] = None):
         # Initialize face detector and facial landmarks predictor
         self.face_detector = dlib.get_frontal_face_detector()
         self.shape_predictor = dlib.shape_predictor('models/shape_predictor_68_face_landmarks.dat')
-        self.face_recognizer = dlib.face_recognition_model_v1('models/dlib_face_recognition_resnet_model_v1.dat')
+        # Descriptor model; FACE_EMBEDDING_BACKEND picks dlib (default) or onnx
+        self.embedding_backend = embedding_backend or create_backend()
+        self.preprocessor = ImagePreprocessor()
+        self.quality_assessor = FaceQualityAssessor()
         
         # Parameters for blink detection
         self.EYE_AR_THRESH = 0.3
@@ -21,10 +27,21 @@ class FacialRecognition:
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
-    def detect_face(self, image: np.ndarray) -> Optional[dlib.rectangle]:
+    @property
+    def template_version(self) -> str:
+        """Version tag to store with templates produced by this instance"""
+        return self.embedding_backend.template_version
+
+    def load_image(self, data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """Decode uploaded image bytes into (bgr_image, gray_image)"""
+        return self.preprocessor.prepare(data)
+
+    def detect_face(self, image: np.ndarray,
+                    gray: Optional[np.ndarray] = None) -> Optional[dlib.rectangle]:
         """Detect face in image and return bounding box"""
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if gray is None:
+                gray = self.preprocessor.to_gray(image)
             faces = self.face_detector(gray)
             
             if len(faces) == 0:
@@ -69,31 +86,63 @@ class FacialRecognition:
         
         return ear < self.EYE_AR_THRESH
 
-    def extract_face_encoding(self, image: np.ndarray, face: dlib.rectangle) -> np.ndarray:
+    def check_quality(self, image: Union[np.ndarray, bytes], face: Optional[dlib.rectangle] = None,
+                      gray: Optional[np.ndarray] = None,
+                      landmarks: Optional[np.ndarray] = None) -> dict:
+        """
+        Run the quality gate on a face; detects the face first if none is given
+
+        Landmarks are computed when not supplied so the pose check always
+        runs; enrollment relies on it to reject non-frontal templates.
+        """
+        if isinstance(image, (bytes, bytearray)):
+            image, gray = self.load_image(bytes(image))
+        if gray is None:
+            gray = self.preprocessor.to_gray(image)
+        if face is None:
+            face = self.detect_face(image, gray)
+            if face is None:
+                return {'passed': False, 'reason': 'no_face', 'metrics': {}}
+        if landmarks is None:
+            landmarks = self.get_facial_landmarks(image, face)
+        return self.quality_assessor.assess(gray, face, landmarks)
+
+    def extract_face_encoding(self, image: np.ndarray, face: dlib.rectangle,
+                              shape: Optional[dlib.full_object_detection] = None) -> np.ndarray:
         """Extract face encoding for face recognition"""
         try:
-            shape = self.shape_predictor(image, face)
-            face_encoding = np.array(self.face_recognizer.compute_face_descriptor(image, shape))
-            return face_encoding
+            if shape is None:
+                shape = self.shape_predictor(image, face)
+            return self.embedding_backend.embed(image, shape)
             
         except Exception as e:
             self.logger.error(f"Error extracting face encoding: {str(e)}")
             return None
 
+    def extract_face_encodings(self, images: List[np.ndarray],
+                               shapes: List[dlib.full_object_detection]) -> np.ndarray:
+        """Extract encodings for several faces in one backend batch"""
+        crops = [self.embedding_backend.align(image, shape) for image, shape in zip(images, shapes)]
+        return self.embedding_backend.embed_batch(crops)
+
     def compare_faces(self, known_encoding: np.ndarray, candidate_encoding: np.ndarray, 
-                     threshold: float = 0.6) -> bool:
+                     threshold: Optional[float] = None) -> bool:
         """Compare face encodings to determine match"""
         if known_encoding is None or candidate_encoding is None:
             return False
+        if threshold is None:
+            threshold = self.embedding_backend.match_threshold
             
         # Calculate euclidean distance between encodings
         distance = np.linalg.norm(known_encoding - candidate_encoding)
         return distance < threshold
 
-    def verify_liveness(self, image: np.ndarray, face: dlib.rectangle) -> bool:
+    def verify_liveness(self, image: np.ndarray, face: dlib.rectangle,
+                        landmarks: Optional[np.ndarray] = None) -> bool:
         """Verify liveness through blink detection and other anti-spoofing measures"""
         try:
-            landmarks = self.get_facial_landmarks(image, face)
+            if landmarks is None:
+                landmarks = self.get_facial_landmarks(image, face)
             
             # Check for natural facial variations/micro-movements
             is_blinking = self.detect_blink(landmarks)
@@ -107,20 +156,51 @@ class FacialRecognition:
             self.logger.error(f"Error in liveness verification: {str(e)}")
             return False
 
-    def process_authentication(self, image: np.ndarray, stored_encoding: np.ndarray) -> Tuple[bool, str]:
-        """Process complete facial authentication including liveness detection"""
+    def process_authentication(self, image: Union[np.ndarray, bytes],
+                               stored_encoding: np.ndarray,
+                               template_version: Optional[str]) -> Tuple[bool, str]:
+        """
+        Process complete facial authentication including liveness detection
+
+        Args:
+            image: Probe image or uploaded image bytes
+            stored_encoding: Enrolled face descriptor
+            template_version: BiometricData.template_version of that descriptor
+        """
         try:
+            # Descriptors from different models are not comparable; untagged
+            # templates predate pluggable backends and are dlib's
+            if not self.embedding_backend.accepts(template_version or LEGACY_TEMPLATE_VERSION):
+                return False, "Face template was enrolled with another model, re-enrollment required"
+
+            # Decode and downscale uploads before any per-pixel work
+            gray = None
+            if isinstance(image, (bytes, bytearray)):
+                image, gray = self.load_image(bytes(image))
+            else:
+                image = self.preprocessor.normalize_size(image)
+                gray = self.preprocessor.to_gray(image)
+
             # Detect face
-            face = self.detect_face(image)
+            face = self.detect_face(image, gray)
             if face is None:
                 return False, "No face detected"
+
+            # Landmarks are shared by liveness, the quality gate and the descriptor
+            shape = self.shape_predictor(image, face)
+            landmarks = np.array([[p.x, p.y] for p in shape.parts()])
                 
             # Verify liveness
-            if not self.verify_liveness(image, face):
+            if not self.verify_liveness(image, face, landmarks):
                 return False, "Liveness check failed"
+
+            # Reject poor probes before the expensive descriptor network
+            quality = self.quality_assessor.assess(gray, face, landmarks)
+            if not quality['passed']:
+                return False, f"Face quality check failed: {quality['reason']}"
                 
             # Extract and compare face encoding
-            candidate_encoding = self.extract_face_encoding(image, face)
+            candidate_encoding = self.extract_face_encoding(image, face, shape)
             if candidate_encoding is None:
                 return False, "Failed to extract face features"
                 
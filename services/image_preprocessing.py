@@ -0,0 +1,147 @@
+import cv2
+import numpy as np
+import struct
+import threading
+from typing import Optional, Tuple
+import logging
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# JPEG start-of-frame markers carrying the image dimensions
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                     0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Decoder flags for libjpeg DCT-domain downscaling, largest factor first
+_REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def read_image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG or PNG header without decoding"""
+    if data[:8] == _PNG_SIGNATURE and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+
+    if data[:2] != b'\xff\xd8':
+        return None
+
+    i = 2
+    length = len(data)
+    while i + 4 <= length:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if i + 9 > length:
+                return None
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        if marker == 0xD9:
+            return None
+        segment_length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        i += 2 + segment_length
+    return None
+
+
+class ImagePreprocessor:
+    """
+    Decode uploaded face images at a bounded working resolution
+
+    Inputs are validated against byte and pixel limits from their header
+    before any decoding happens. JPEGs are decoded directly at a reduced
+    scale so large phone photos never materialize at full resolution, and
+    the grayscale conversion writes into a per-thread buffer that is reused
+    across requests.
+    """
+
+    def __init__(self, max_side: int = Config.FACE_IMAGE_MAX_SIDE,
+                 max_bytes: int = Config.MAX_IMAGE_BYTES,
+                 max_pixels: int = Config.MAX_IMAGE_PIXELS):
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self._local = threading.local()
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """
+        Decode image bytes to a BGR image no larger than max_side
+
+        Args:
+            data: Encoded JPEG or PNG bytes
+
+        Returns:
+            np.ndarray: Decoded BGR image with EXIF orientation applied
+
+        Raises:
+            ValueError: If the input is oversized or cannot be decoded
+        """
+        if len(data) > self.max_bytes:
+            raise ValueError(f"Image exceeds {self.max_bytes} bytes")
+
+        size = read_image_size(data)
+        if size is None:
+            raise ValueError("Unsupported image format")
+        width, height = size
+        if width * height > self.max_pixels:
+            raise ValueError(f"Image exceeds {self.max_pixels} pixels")
+
+        flags = cv2.IMREAD_COLOR
+        scale = max(width, height) / self.max_side
+        for factor, reduced_flag in _REDUCED_COLOR_FLAGS:
+            if scale >= factor:
+                flags = reduced_flag
+                break
+
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        image = cv2.imdecode(buffer, flags)
+        if image is None:
+            raise ValueError("Failed to decode image")
+
+        return self.normalize_size(image)
+
+    def normalize_size(self, image: np.ndarray) -> np.ndarray:
+        """Downscale an image so its longest side is at most max_side"""
+        height, width = image.shape[:2]
+        longest = max(height, width)
+        if longest <= self.max_side:
+            return image
+
+        ratio = self.max_side / longest
+        return cv2.resize(image, (max(1, int(width * ratio)), max(1, int(height * ratio))),
+                          interpolation=cv2.INTER_AREA)
+
+    def to_gray(self, image: np.ndarray) -> np.ndarray:
+        """
+        Convert a BGR image to grayscale in a reusable per-thread buffer
+
+        The returned array is a view that is overwritten by the next call
+        on the same thread; copy it if it has to outlive the request.
+        """
+        height, width = image.shape[:2]
+        buffer = getattr(self._local, 'gray', None)
+        if buffer is None or buffer.size < height * width:
+            capacity = max(height * width, self.max_side * self.max_side)
+            buffer = np.empty(capacity, dtype=np.uint8)
+            self._local.gray = buffer
+
+        gray = buffer[:height * width].reshape(height, width)
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=gray)
+        return gray
+
+    def prepare(self, data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """Decode image bytes and return (bgr_image, gray_image)"""
+        image = self.decode(data)
+        return image, self.to_gray(image)
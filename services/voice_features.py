@@ -0,0 +1,251 @@
+import numpy as np
+import struct
+from math import gcd
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+from typing import List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_audio(audio_path: str, sample_rate: int) -> np.ndarray:
+    """
+    Load an audio file as mono float32 in [-1, 1] at the given sample rate
+
+    WAV files are read directly with scipy; other containers (for example
+    MediaRecorder webm/ogg uploads) fall back to librosa, which is only
+    imported when such a file is actually seen.
+    """
+    try:
+        sr, audio = wavfile.read(audio_path)
+    except ValueError:
+        import librosa
+        audio, _ = librosa.load(audio_path, sr=sample_rate)
+        return audio.astype(np.float32, copy=False)
+
+    if audio.dtype == np.uint8:
+        # 8-bit WAV is the one unsigned PCM format; silence sits at 128
+        audio = (audio.astype(np.float32) - 128.0) / 128.0
+    elif np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype(np.float32) / float(np.iinfo(audio.dtype).max + 1)
+    else:
+        audio = audio.astype(np.float32, copy=False)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+
+    if sr != sample_rate:
+        factor = gcd(sr, sample_rate)
+        audio = resample_poly(audio, sample_rate // factor, sr // factor).astype(np.float32)
+    return audio
+
+
+class MFCCExtractor:
+    """
+    MFCC front end with precomputed filterbank, window and DCT matrices
+
+    Produces the same features as ``python_speech_features.mfcc`` with the
+    parameters the voice service has always used (rectangular window,
+    0.97 pre-emphasis, liftering, log energy in the first coefficient),
+    but builds its matrices once and frames audio with zero-copy strided
+    views. Several utterances can be processed in one vectorized call.
+    """
+
+    def __init__(self, sample_rate: int = 16000, n_mfcc: int = 13,
+                 n_filters: int = 26, n_fft: int = 1024,
+                 win_length: float = 0.025, win_step: float = 0.01,
+                 preemphasis: float = 0.97, ceplifter: int = 22,
+                 low_freq: float = 0.0, high_freq: Optional[float] = None):
+        self.sample_rate = sample_rate
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.preemphasis = preemphasis
+        # python_speech_features rounds half up when converting to samples
+        self.frame_length = int(np.floor(win_length * sample_rate + 0.5))
+        self.frame_step = int(np.floor(win_step * sample_rate + 0.5))
+
+        self.window = np.ones(self.frame_length, dtype=np.float64)
+        self.filterbank = self._build_filterbank(n_filters, low_freq,
+                                                 high_freq or sample_rate / 2)
+        # Liftering is folded into the DCT basis so both are one matmul
+        self.dct_matrix = self._build_dct(n_filters, n_mfcc) * self._build_lifter(n_mfcc, ceplifter)
+
+    @staticmethod
+    def _hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700.0)
+
+    @staticmethod
+    def _mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595.0) - 1)
+
+    def _build_filterbank(self, n_filters: int, low_freq: float,
+                          high_freq: float) -> np.ndarray:
+        """Triangular mel filterbank, transposed to (n_fft // 2 + 1, n_filters)"""
+        mel_points = np.linspace(self._hz_to_mel(low_freq), self._hz_to_mel(high_freq),
+                                 n_filters + 2)
+        bins = np.floor((self.n_fft + 1) * self._mel_to_hz(mel_points) / self.sample_rate)
+
+        fbank = np.zeros((n_filters, self.n_fft // 2 + 1))
+        for j in range(n_filters):
+            left, center, right = bins[j], bins[j + 1], bins[j + 2]
+            rising = np.arange(int(left), int(center))
+            fbank[j, rising] = (rising - left) / (center - left)
+            falling = np.arange(int(center), int(right))
+            fbank[j, falling] = (right - falling) / (right - center)
+        return np.ascontiguousarray(fbank.T)
+
+    @staticmethod
+    def _build_dct(n_filters: int, n_mfcc: int) -> np.ndarray:
+        """Orthonormal DCT-II basis of shape (n_filters, n_mfcc)"""
+        n = np.arange(n_filters)
+        k = np.arange(n_mfcc)
+        basis = np.cos(np.pi * np.outer(2 * n + 1, k) / (2 * n_filters))
+        scale = np.full(n_mfcc, np.sqrt(2.0 / n_filters))
+        scale[0] = np.sqrt(1.0 / n_filters)
+        return basis * scale
+
+    @staticmethod
+    def _build_lifter(n_mfcc: int, ceplifter: int) -> np.ndarray:
+        if ceplifter <= 0:
+            return np.ones(n_mfcc)
+        return 1 + (ceplifter / 2.0) * np.sin(np.pi * np.arange(n_mfcc) / ceplifter)
+
+    def num_frames(self, n_samples: int) -> int:
+        """Number of frames produced for a signal of n_samples"""
+        if n_samples <= self.frame_length:
+            return 1
+        return 1 + int(np.ceil((n_samples - self.frame_length) / self.frame_step))
+
+    def frame(self, audio: np.ndarray) -> np.ndarray:
+        """
+        Pre-emphasize and split audio into overlapping frames
+
+        The returned array is a strided view over one padded copy of the
+        signal, so no per-frame buffers are allocated.
+        """
+        n_frames = self.num_frames(len(audio))
+        padded = np.zeros((n_frames - 1) * self.frame_step + self.frame_length)
+        if len(audio):
+            padded[0] = audio[0]
+            np.subtract(audio[1:], self.preemphasis * audio[:-1], out=padded[1:len(audio)])
+        frames = np.lib.stride_tricks.sliding_window_view(padded, self.frame_length)
+        return frames[::self.frame_step]
+
+    def _features(self, frames: np.ndarray) -> np.ndarray:
+        spectrum = np.fft.rfft(frames * self.window, n=self.n_fft)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2) / self.n_fft
+
+        energy = power.sum(axis=1)
+        energy[energy == 0] = np.finfo(float).eps
+        mel_energies = power @ self.filterbank
+        mel_energies[mel_energies == 0] = np.finfo(float).eps
+
+        features = np.log(mel_energies) @ self.dct_matrix
+        features[:, 0] = np.log(energy)
+        return features
+
+    def extract(self, audio: np.ndarray) -> np.ndarray:
+        """Compute MFCCs of shape (n_frames, n_mfcc) for one utterance"""
+        return self._features(self.frame(np.asarray(audio, dtype=np.float64)))
+
+    def extract_batch(self, utterances: Sequence[np.ndarray]) -> List[np.ndarray]:
+        """Compute MFCCs for several utterances with a single FFT and matmul"""
+        if not utterances:
+            return []
+        framed = [self.frame(np.asarray(audio, dtype=np.float64)) for audio in utterances]
+        features = self._features(np.concatenate(framed))
+        return np.split(features, np.cumsum([len(f) for f in framed])[:-1])
+
+
+# Voice template layout: magic, n_mfcc, reserved, n_frames, then float32
+# mean, std and the CMVN-normalized feature matrix.
+VOICE_TEMPLATE_MAGIC = b'VTP1'
+_VOICE_TEMPLATE_HEADER = struct.Struct('<4sHHI')
+STD_FLOOR = 1e-8
+
+
+def compute_cmvn_stats(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-coefficient cepstral mean and standard deviation of an utterance"""
+    return features.mean(axis=0), features.std(axis=0)
+
+
+def apply_cmvn(features: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+    """
+    Normalize features with explicit statistics
+
+    This is a pure function, so it is safe to call concurrently from any
+    thread or process. Coefficients with zero variance are only centered,
+    matching StandardScaler.
+    """
+    scale = np.where(std > STD_FLOOR, std, 1.0)
+    return (features - mean) / scale
+
+
+def pack_voice_template(features: np.ndarray, mean: np.ndarray, std: np.ndarray) -> bytes:
+    """Serialize normalized features together with their CMVN statistics"""
+    n_frames, n_mfcc = features.shape
+    return b''.join((
+        _VOICE_TEMPLATE_HEADER.pack(VOICE_TEMPLATE_MAGIC, n_mfcc, 0, n_frames),
+        np.asarray(mean, dtype='<f4').tobytes(),
+        np.asarray(std, dtype='<f4').tobytes(),
+        np.asarray(features, dtype='<f4').tobytes(),
+    ))
+
+
+def unpack_voice_template(template: bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Deserialize a voice template
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (features, mean, std)
+
+    Raises:
+        ValueError: If the template is not in the packed format
+    """
+    magic, n_mfcc, _, n_frames = _VOICE_TEMPLATE_HEADER.unpack_from(template)
+    if magic != VOICE_TEMPLATE_MAGIC:
+        raise ValueError("Unsupported voice template format")
+    data = np.frombuffer(template, dtype='<f4', offset=_VOICE_TEMPLATE_HEADER.size)
+    if len(data) != n_mfcc * (n_frames + 2):
+        raise ValueError("Truncated voice template")
+    mean, std = data[:n_mfcc], data[n_mfcc:2 * n_mfcc]
+    return data[2 * n_mfcc:].reshape(n_frames, n_mfcc), mean, std
+
+
+class OnlineCMVN:
+    """
+    Streaming cepstral mean/variance normalization for chunked audio
+
+    Statistics are accumulated as chunks arrive and each chunk is
+    normalized with everything seen so far. Enrollment statistics can be
+    supplied as a prior, weighted as if they were ``prior_frames`` frames,
+    so the first chunks are normalized sensibly before enough speech has
+    been seen. Each instance belongs to a single stream.
+    """
+
+    def __init__(self, n_dims: int, prior_mean: Optional[np.ndarray] = None,
+                 prior_std: Optional[np.ndarray] = None, prior_frames: int = 100):
+        self.count = 0.0
+        self.total = np.zeros(n_dims)
+        self.total_sq = np.zeros(n_dims)
+        if prior_mean is not None and prior_std is not None:
+            self.count = float(prior_frames)
+            self.total = np.asarray(prior_mean, dtype=np.float64) * prior_frames
+            self.total_sq = (np.asarray(prior_std, dtype=np.float64) ** 2 +
+                             np.asarray(prior_mean, dtype=np.float64) ** 2) * prior_frames
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.total / max(self.count, 1.0)
+
+    @property
+    def std(self) -> np.ndarray:
+        variance = self.total_sq / max(self.count, 1.0) - self.mean ** 2
+        return np.sqrt(np.maximum(variance, 0.0))
+
+    def update(self, features: np.ndarray) -> np.ndarray:
+        """Add a chunk of frames to the statistics and return it normalized"""
+        self.count += len(features)
+        self.total += features.sum(axis=0)
+        self.total_sq += np.square(features).sum(axis=0)
+        return apply_cmvn(features, self.mean, self.std)
@@ -1,43 +1,140 @@
 import os
-import librosa
 import numpy as np
-from scipy.io import wavfile
-from python_speech_features import mfcc
-from sklearn.preprocessing import StandardScaler
-from typing import Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 import logging
 from pathlib import Path
 
+from config.config import Config
+from services.voice_features import (
+    MFCCExtractor, OnlineCMVN, apply_cmvn, compute_cmvn_stats, load_audio,
+    pack_voice_template, unpack_voice_template
+)
+
 logger = logging.getLogger(__name__)
 
 class VoiceRecognitionService:
     def __init__(self):
-        self.sample_rate = 16000
+        self.sample_rate = Config.VOICE_SAMPLE_RATE
         self.n_mfcc = 13
-        self.scaler = StandardScaler()
+        self.feature_extractor = MFCCExtractor(sample_rate=self.sample_rate,
+                                               n_mfcc=self.n_mfcc,
+                                               n_filters=26,
+                                               n_fft=1024)
         
-    def extract_features(self, audio_path: str) -> Optional[np.ndarray]:
-        """Extract MFCC features from audio file"""
+    def analyze_signal(self, audio: np.ndarray) -> Dict[str, Any]:
+        """
+        Compute per-frame RMS energy and zero crossings in one pass
+
+        Frames are non-overlapping blocks of one MFCC hop (10 ms). The
+        result feeds both liveness detection and voice activity detection.
+        """
+        hop = self.feature_extractor.frame_step
+        n_frames = len(audio) // hop
+        usable = audio[:n_frames * hop]
+        blocks = usable.reshape(n_frames, hop)
+
+        rms = np.sqrt(np.einsum('ij,ij->i', blocks, blocks) / hop)
+        signs = np.signbit(usable)
+        crossings = np.zeros(len(usable), dtype=bool)
+        np.not_equal(signs[1:], signs[:-1], out=crossings[1:])
+        zero_crossings = crossings.reshape(n_frames, hop).sum(axis=1)
+
+        # Thresholds for live voice detection
+        zc_threshold = 1000
+        rms_threshold = 0.05
+        is_live = bool(zero_crossings.sum() > zc_threshold and
+                       rms.mean() > rms_threshold)
+
+        return {'rms': rms, 'zero_crossings': zero_crossings, 'is_live': is_live}
+
+    def trim_silence(self, audio: np.ndarray, signal_stats: Dict[str, Any]) -> np.ndarray:
+        """
+        Keep only voiced frames, dropping leading, trailing and inner silence
+
+        A frame is voiced when its energy is above an adaptive threshold, or
+        moderately energetic with a high zero-crossing rate (unvoiced
+        consonants). Voiced regions are widened by a short hangover so word
+        edges are kept. Falls back to the full signal if nothing is voiced.
+        """
+        rms = signal_stats['rms']
+        if not Config.VOICE_VAD_ENABLED or not len(rms):
+            return audio
+
+        hop = self.feature_extractor.frame_step
+        zcr = signal_stats['zero_crossings'] / hop
+        threshold = max(Config.VOICE_VAD_MIN_RMS,
+                        Config.VOICE_VAD_RELATIVE_THRESHOLD * np.percentile(rms, 95))
+        voiced = (rms > threshold) | ((rms > threshold / 2) & (zcr > Config.VOICE_VAD_ZCR_THRESHOLD))
+
+        hangover = Config.VOICE_VAD_HANGOVER_FRAMES
+        if hangover > 0:
+            voiced = np.convolve(voiced, np.ones(2 * hangover + 1), mode='same') > 0
+        if not voiced.any():
+            return audio
+
+        blocks = audio[:len(rms) * hop].reshape(len(rms), hop)
+        return blocks[voiced].ravel()
+
+    def prepare_utterance(self, audio_path: str) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """Load audio, scan it once, and return (voiced_audio, signal_stats)"""
+        audio = load_audio(audio_path, self.sample_rate)
+        signal_stats = self.analyze_signal(audio)
+        return self.trim_silence(audio, signal_stats), signal_stats
+
+    def extract_raw_features(self, audio_path: str) -> Optional[np.ndarray]:
+        """Extract unnormalized MFCC features from the voiced part of an audio file"""
+        try:
+            voiced, _ = self.prepare_utterance(audio_path)
+            return self.feature_extractor.extract(voiced)
+
+        except Exception as e:
+            logger.error(f"Error extracting voice features: {str(e)}")
+            return None
+
+    def extract_features(self, audio_path: str,
+                         stats: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Optional[np.ndarray]:
+        """
+        Extract CMVN-normalized MFCC features from audio file
+
+        Normalizes with the given (mean, std) statistics, typically those
+        stored with the enrolled template, or with the utterance's own
+        statistics when none are given.
+        """
         try:
-            # Load audio file
-            audio, sr = librosa.load(audio_path, sr=self.sample_rate)
-            
             # Extract MFCC features
-            mfcc_features = mfcc(audio, 
-                               samplerate=sr,
-                               numcep=self.n_mfcc,
-                               nfilt=26,
-                               nfft=1024)
-            
+            mfcc_features = self.extract_raw_features(audio_path)
+            if mfcc_features is None:
+                return None
+
             # Normalize features
-            mfcc_scaled = self.scaler.fit_transform(mfcc_features)
-            
-            return mfcc_scaled
+            mean, std = stats if stats is not None else compute_cmvn_stats(mfcc_features)
+            return apply_cmvn(mfcc_features, mean, std)
             
         except Exception as e:
             logger.error(f"Error extracting voice features: {str(e)}")
             return None
 
+    def extract_features_batch(self, audio_paths: List[str]) -> List[Optional[np.ndarray]]:
+        """Extract MFCC features for several audio files in one vectorized pass"""
+        audio, loaded = [], []
+        for path in audio_paths:
+            try:
+                audio.append(load_audio(path, self.sample_rate))
+                loaded.append(path)
+            except Exception as e:
+                logger.error(f"Error loading audio {path}: {str(e)}")
+                continue
+            audio[-1] = self.trim_silence(audio[-1], self.analyze_signal(audio[-1]))
+
+        features = dict(zip(loaded, self.feature_extractor.extract_batch(audio)))
+        results = []
+        for path in audio_paths:
+            if path in features:
+                results.append(apply_cmvn(features[path], *compute_cmvn_stats(features[path])))
+            else:
+                results.append(None)
+        return results
+
     def compare_voices(self, voice1_features: np.ndarray, 
                       voice2_features: np.ndarray) -> Tuple[float, bool]:
         """Compare two voice feature sets and return similarity score"""
@@ -76,15 +173,24 @@ class VoiceRecognitionService:
         return D[r, c]
 
     def verify_voice(self, enrolled_path: str, 
-                    verification_path: str) -> Tuple[bool, float]:
-        """Verify if two voice recordings match"""
+                    verification_path: str,
+                    require_liveness: bool = False) -> Tuple[bool, float]:
+        """
+        Verify if two voice recordings match
+
+        With require_liveness, probes failing the liveness check of the same
+        scan are rejected; off by default so acceptance is unchanged.
+        """
         try:
             # Extract features
             enrolled_features = self.extract_features(enrolled_path)
-            verify_features = self.extract_features(verification_path)
+            verify_features, is_live = self.extract_features_with_liveness(verification_path)
             
             if enrolled_features is None or verify_features is None:
                 return False, 0.0
+            if require_liveness and not is_live:
+                logger.warning("Voice probe failed liveness detection")
+                return False, 0.0
                 
             # Compare features
             similarity, is_match = self.compare_voices(enrolled_features, 
@@ -96,6 +202,56 @@ class VoiceRecognitionService:
             logger.error(f"Error in voice verification: {str(e)}")
             return False, 0.0
             
+    def verify_voice_template(self, template: bytes,
+                              verification_path: str,
+                              require_liveness: bool = False) -> Tuple[bool, float]:
+        """
+        Verify a recording against a stored template using its CMVN statistics
+
+        With require_liveness, liveness is judged from the same scan that
+        feeds feature extraction, so callers need not run is_live_voice()
+        separately. Off by default so acceptance is unchanged.
+        """
+        try:
+            enrolled_features, mean, std = unpack_voice_template(template)
+            verify_features, is_live = self.extract_features_with_liveness(
+                verification_path, stats=(mean, std))
+            if verify_features is None:
+                return False, 0.0
+            if require_liveness and not is_live:
+                logger.warning("Voice probe failed liveness detection")
+                return False, 0.0
+
+            similarity, is_match = self.compare_voices(enrolled_features,
+                                                     verify_features)
+
+            return is_match, similarity
+
+        except Exception as e:
+            logger.error(f"Error in voice verification: {str(e)}")
+            return False, 0.0
+
+    def create_template(self, audio_path: str) -> Optional[bytes]:
+        """Create a storable voice template with its enrollment CMVN statistics"""
+        try:
+            mfcc_features = self.extract_raw_features(audio_path)
+            if mfcc_features is None:
+                return None
+
+            mean, std = compute_cmvn_stats(mfcc_features)
+            return pack_voice_template(apply_cmvn(mfcc_features, mean, std), mean, std)
+
+        except Exception as e:
+            logger.error(f"Error creating voice template: {str(e)}")
+            return None
+
+    def stream_normalizer(self, template: Optional[bytes] = None) -> OnlineCMVN:
+        """Create a streaming CMVN for chunked audio, seeded from a template if given"""
+        if template is None:
+            return OnlineCMVN(self.n_mfcc)
+        _, mean, std = unpack_voice_template(template)
+        return OnlineCMVN(self.n_mfcc, prior_mean=mean, prior_std=std)
+
     def enroll_voice(self, audio_path: str) -> Optional[np.ndarray]:
         """Enroll a voice sample and return features for storage"""
         try:
@@ -111,20 +267,28 @@ class VoiceRecognitionService:
     def is_live_voice(self, audio_path: str) -> bool:
         """Check if voice sample is from a live person vs recording"""
         try:
-            # Load audio
-            audio, sr = librosa.load(audio_path, sr=self.sample_rate)
-            
-            # Extract features indicating live voice
-            zero_crossings = librosa.zero_crossings(audio).sum()
-            rms_energy = librosa.feature.rms(y=audio)[0].mean()
-            
-            # Thresholds for live voice detection
-            zc_threshold = 1000
-            rms_threshold = 0.05
-            
-            return (zero_crossings > zc_threshold and 
-                   rms_energy > rms_threshold)
+            audio = load_audio(audio_path, self.sample_rate)
+            return self.analyze_signal(audio)['is_live']
                    
         except Exception as e:
             logger.error(f"Error in liveness detection: {str(e)}")
             return False
+
+    def extract_features_with_liveness(self, audio_path: str,
+                                       stats: Optional[Tuple[np.ndarray, np.ndarray]] = None
+                                       ) -> Tuple[Optional[np.ndarray], bool]:
+        """
+        Run liveness detection and feature extraction from a single scan
+
+        Returns:
+            Tuple[Optional[np.ndarray], bool]: (normalized features, is_live)
+        """
+        try:
+            voiced, signal_stats = self.prepare_utterance(audio_path)
+            mfcc_features = self.feature_extractor.extract(voiced)
+            mean, std = stats if stats is not None else compute_cmvn_stats(mfcc_features)
+            return apply_cmvn(mfcc_features, mean, std), signal_stats['is_live']
+
+        except Exception as e:
+            logger.error(f"Error extracting voice features: {str(e)}")
+            return None, False
@@ -0,0 +1,101 @@
+import os
+import threading
+
+import numpy as np
+
+from utils.template_store import ID_DTYPE, TemplateStore
+
+DIM = 4
+
+
+def template(user_id: int, version: int = 0) -> np.ndarray:
+    # Encodes its owner so a reader can tell if it got someone else's row
+    return np.full(DIM, user_id + 1000 * version, dtype=np.float32)
+
+
+def owner(vector: np.ndarray) -> int:
+    return int(vector[0]) % 1000
+
+
+def make_store(tmp_path) -> TemplateStore:
+    return TemplateStore(str(tmp_path), dim=DIM, dtype='float32')
+
+
+def test_torn_append_does_not_shift_rows(tmp_path):
+    store = make_store(tmp_path)
+    store.append([1, 2], np.vstack([template(1), template(2)]))
+
+    # Crash after writing one and a half vectors but none of their ids
+    with open(store._file(store._generation, 'vec'), 'ab') as f:
+        f.write(template(7).tobytes() + template(8).tobytes()[:6])
+    # ... and a torn id from another crashed append
+    with open(store._file(store._generation, 'ids'), 'ab') as f:
+        f.write(np.array([9], dtype=ID_DTYPE).tobytes()[:3])
+
+    store.append([3], template(3)[None])
+    assert store.refresh() is False
+    for user_id in (1, 2, 3):
+        assert owner(store.get(user_id)) == user_id
+    assert len(store) == 3
+
+
+def test_crash_before_tombstone_prefers_newest_row(tmp_path):
+    store = make_store(tmp_path)
+    store.append([1, 2], np.vstack([template(1), template(2)]))
+
+    # New row for user 1 written, tombstone for the old row never written
+    generation = store._generation
+    with open(store._file(generation, 'vec'), 'ab') as f:
+        f.write(template(1, version=1).tobytes())
+    with open(store._file(generation, 'ids'), 'ab') as f:
+        f.write(np.array([1], dtype=ID_DTYPE).tobytes())
+
+    store.refresh()
+    assert store.get(1)[0] == template(1, version=1)[0]
+    assert len(store) == 2
+    assert sorted(uid for ids, _ in store.iter_live() for uid in ids) == [1, 2]
+
+    store.delete([1])
+    assert store.get(1) is None
+    store.compact()
+    assert store.get(1) is None and owner(store.get(2)) == 2
+
+
+def test_compaction_racing_reader(tmp_path):
+    users = list(range(1, 51))
+    store = make_store(tmp_path)
+    store.append(users, np.vstack([template(u) for u in users]))
+
+    stop = threading.Event()
+    errors = []
+
+    def write():
+        version = 1
+        while not stop.is_set():
+            store.append(users[::3], np.vstack([template(u, version) for u in users[::3]]))
+            store.compact()
+            version += 1
+
+    def read():
+        reader = make_store(tmp_path)
+        while not stop.is_set():
+            try:
+                reader.refresh()
+                for user_id in users:
+                    vector = reader.get(user_id)
+                    assert vector is not None and owner(vector) == user_id
+                for user_id, _ in reader.search(template(5), k=3):
+                    assert user_id in users
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    stop.wait(1.5)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    assert len(os.listdir(tmp_path)) <= 8
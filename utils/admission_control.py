@@ -0,0 +1,233 @@
+import bisect
+import itertools
+import math
+import threading
+import time
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from flask import jsonify, request
+
+from config.config import Config
+
+# Header carrying the client's remaining time budget in milliseconds
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+EWMA_ALPHA = 0.2
+# Client errors end before any biometric work (missing fields, unknown
+# user, duplicate username), except 401, which the auth endpoints return
+# after a failed verification
+UNMEASURED_STATUS = range(400, 500)
+MEASURED_CLIENT_ERRORS = (401,)
+
+
+class EndpointPolicy:
+    def __init__(self, name: str, priority: int, max_concurrency: int,
+                 default_deadline: float, initial_service_time: float = 0.5):
+        """
+        Args:
+            name: Endpoint identifier
+            priority: Lower values are served first
+            max_concurrency: Requests of this endpoint allowed to run at once
+            default_deadline: Time budget in seconds when the client sends none
+            initial_service_time: Service time estimate before any request completes
+        """
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.default_deadline = default_deadline
+        self.service_time = initial_service_time
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.completed = 0
+        self.shed = 0
+        self.expired = 0
+
+
+class AdmissionController:
+    """
+    Priority admission with per-endpoint limits and deadline-based shedding
+
+    Requests run when a global slot and a slot for their endpoint are free.
+    Otherwise they wait in a queue ordered by priority, then deadline. A
+    request is rejected up front when the estimated queue wait plus its
+    own service time would overrun its deadline, and dropped from the
+    queue if the deadline passes while waiting, so no CPU is spent on
+    requests the client has already given up on.
+    """
+
+    def __init__(self, total_slots: int, policies: Dict[str, EndpointPolicy]):
+        self.total_slots = max(1, total_slots)
+        self.policies = policies
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        # Sorted list of (priority, deadline, seq, endpoint)
+        self._waiting = []
+        self._seq = itertools.count()
+
+    def acquire(self, endpoint: str, deadline: float) -> Tuple[bool, float]:
+        """
+        Wait for a slot or reject
+
+        Args:
+            endpoint: Endpoint name
+            deadline: Absolute time.monotonic() by which the response is needed
+
+        Returns:
+            Tuple[bool, float]: (admitted, suggested retry-after seconds)
+        """
+        policy = self.policies[endpoint]
+        with self._cond:
+            ticket = (policy.priority, deadline, next(self._seq), endpoint)
+            now = time.monotonic()
+            wait = self._estimate_wait(ticket)
+            if now + wait + policy.service_time > deadline:
+                policy.shed += 1
+                return False, self._retry_after(wait)
+
+            bisect.insort(self._waiting, ticket)
+            policy.queued += 1
+            try:
+                while self._next_runnable() != ticket:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        policy.expired += 1
+                        return False, self._retry_after(self._estimate_wait(ticket))
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                policy.queued -= 1
+
+            self._in_flight += 1
+            policy.in_flight += 1
+            policy.admitted += 1
+            # Another waiter may be runnable too if slots remain
+            self._cond.notify_all()
+            return True, 0.0
+
+    def release(self, endpoint: str, service_time: float, status: Optional[int] = None) -> None:
+        """
+        Free a slot and fold the observed service time into the estimate
+
+        Requests rejected early with a client error are not folded in, so a
+        stream of bad requests cannot pull the estimate below the cost of
+        real work.
+        """
+        policy = self.policies[endpoint]
+        with self._cond:
+            self._in_flight -= 1
+            policy.in_flight -= 1
+            policy.completed += 1
+            if status not in UNMEASURED_STATUS or status in MEASURED_CLIENT_ERRORS:
+                policy.service_time += EWMA_ALPHA * (service_time - policy.service_time)
+            self._cond.notify_all()
+
+    def _next_runnable(self) -> Optional[tuple]:
+        if self._in_flight >= self.total_slots:
+            return None
+        for ticket in self._waiting:
+            policy = self.policies[ticket[3]]
+            if policy.in_flight < policy.max_concurrency:
+                return ticket
+        return None
+
+    def _estimate_wait(self, ticket: tuple) -> float:
+        """Queue wait estimate: work ahead of the ticket spread over all slots"""
+        policy = self.policies[ticket[3]]
+        ahead = [queued for queued in self._waiting if queued < ticket]
+        if (not ahead and self._in_flight < self.total_slots
+                and policy.in_flight < policy.max_concurrency):
+            return 0.0
+        # Running requests are on average half done
+        work = sum(p.in_flight * p.service_time / 2 for p in self.policies.values())
+        work += sum(self.policies[queued[3]].service_time for queued in ahead)
+        return work / self.total_slots
+
+    @staticmethod
+    def _retry_after(wait: float) -> float:
+        return max(1.0, math.ceil(wait))
+
+    def stats(self) -> Dict[str, dict]:
+        """Queue depth, shed counts and service time estimates per endpoint"""
+        with self._cond:
+            return {
+                'in_flight': self._in_flight,
+                'queued': len(self._waiting),
+                'total_slots': self.total_slots,
+                'endpoints': {
+                    name: {
+                        'priority': p.priority,
+                        'in_flight': p.in_flight,
+                        'queued': p.queued,
+                        'admitted': p.admitted,
+                        'completed': p.completed,
+                        'shed': p.shed,
+                        'expired': p.expired,
+                        'service_time_ms': round(p.service_time * 1000, 1),
+                    } for name, p in self.policies.items()
+                }
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Process-wide controller for the auth endpoints, built from Config"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController(Config.ADMISSION_TOTAL_SLOTS, {
+                    'authenticate': EndpointPolicy('authenticate', 0,
+                                                   Config.ADMISSION_LIMIT_AUTHENTICATE,
+                                                   Config.ADMISSION_DEADLINE_AUTHENTICATE),
+                    'update_biometrics': EndpointPolicy('update_biometrics', 1,
+                                                        Config.ADMISSION_LIMIT_UPDATE,
+                                                        Config.ADMISSION_DEADLINE_UPDATE),
+                    'register': EndpointPolicy('register', 2,
+                                               Config.ADMISSION_LIMIT_REGISTER,
+                                               Config.ADMISSION_DEADLINE_REGISTER),
+                })
+    return _controller
+
+
+def _status_code(rv) -> int:
+    """Status of a view return value: a response or a (body, status) tuple"""
+    if isinstance(rv, tuple) and len(rv) > 1 and isinstance(rv[1], int):
+        return rv[1]
+    return getattr(rv, 'status_code', 200)
+
+
+def admission_controlled(endpoint: str):
+    """Route decorator applying admission control with the endpoint's policy"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            controller = get_admission_controller()
+            budget = controller.policies[endpoint].default_deadline
+            header = request.headers.get(DEADLINE_HEADER)
+            if header:
+                try:
+                    budget = min(budget, max(float(header), 0.0) / 1000)
+                except ValueError:
+                    pass
+
+            admitted, retry_after = controller.acquire(endpoint, time.monotonic() + budget)
+            if not admitted:
+                response = jsonify({'message': 'Server is busy, please retry'})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(int(retry_after))
+                return response
+
+            start = time.monotonic()
+            status = None
+            try:
+                rv = f(*args, **kwargs)
+                status = _status_code(rv)
+                return rv
+            finally:
+                controller.release(endpoint, time.monotonic() - start, status)
+        return decorated_function
+    return decorator
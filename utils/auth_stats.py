@@ -0,0 +1,467 @@
+"""Pre-aggregated authentication statistics.
+
+Every authentication attempt increments per-minute and per-hour counters
+in Redis, keyed by auth_type, success and failure_reason, plus an hourly
+counter for the user concerned. Closed buckets are periodically compacted
+into the auth_stats_rollups and auth_user_activity tables, so a dashboard
+or per-user query reads at most AUTH_STATS_MAX_BUCKETS buckets no matter
+how much history authentication_logs holds.
+
+Usage:
+    python -m utils.auth_stats compact
+    python -m utils.auth_stats show [minute|hour] [BUCKETS]
+    python -m utils.auth_stats user USER_ID [HOURS]
+"""
+import calendar
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from config.config import Config
+from models.models import AuthStatsRollup, AuthUserActivity
+from utils.cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {'minute': 60, 'hour': 3600}
+# Per-user hourly buckets: one Redis hash per user plus a set of the users
+# active in the hour, which compaction walks
+USER_BUCKETS = 'user'
+BUCKET_SECONDS = {**GRANULARITIES, USER_BUCKETS: 3600}
+# Redis keeps buckets long enough to be compacted and to serve the open window
+REDIS_TTL = {'minute': 3 * 3600, 'hour': 3 * 86400, USER_BUCKETS: 3 * 86400}
+PENDING_KEY = 'auth_stats:pending'
+LOCK_KEY = 'auth_stats:compaction_lock'
+# Seconds after a bucket closes before it is compacted, for slow requests
+COMPACTION_GRACE = 30
+
+StatKey = Tuple[str, bool, str]
+
+# Failure messages reduced to a fixed set of codes by prefix, so neither
+# Redis fields nor rollup rows grow with free-form (e.g. exception) text
+FAILURE_CODES = (
+    ('User not found', 'user_not_found'),
+    ('No biometric data', 'not_enrolled'),
+    ('Too many failed attempts', 'locked_out'),
+    ('Face verification failed', 'face_mismatch'),
+    ('Voice verification failed', 'voice_mismatch'),
+    ('No face detected', 'no_face'),
+    ('Liveness check failed', 'liveness'),
+    ('Face quality check failed', 'quality'),
+    ('Face template was enrolled with another model', 'template_version'),
+    ('Failed to extract', 'extraction'),
+    ('Internal', 'internal'),
+    ('Authentication error', 'internal'),
+)
+OTHER_FAILURE = 'other'
+
+
+def failure_code(reason: Optional[str]) -> str:
+    """Map a failure message to one of the FAILURE_CODES codes"""
+    for prefix, code in FAILURE_CODES:
+        if reason and reason.startswith(prefix):
+            return code
+    return OTHER_FAILURE
+
+
+def _bucket_key(granularity: str, start: int) -> str:
+    return f"auth_stats:{granularity}:{start}"
+
+
+def _user_key(start: int, user_id: int) -> str:
+    return f"auth_stats:{USER_BUCKETS}:{start}:{user_id}"
+
+
+def _field(auth_type: str, success: bool, failure_reason: str) -> str:
+    return f"{auth_type}|{int(success)}|{failure_reason}"
+
+
+def _parse_field(field: bytes) -> StatKey:
+    auth_type, success, failure_reason = field.decode().split('|', 2)
+    return auth_type, success == '1', failure_reason
+
+
+def _to_datetime(epoch: int) -> datetime:
+    return datetime.utcfromtimestamp(epoch)
+
+
+def _to_epoch(value: datetime) -> int:
+    return calendar.timegm(value.timetuple())
+
+
+def _window(step: int, buckets: int, now: Optional[float]) -> Tuple[int, int]:
+    """Start and end of the most recent ``buckets`` buckets, the open one included"""
+    buckets = max(1, min(buckets, Config.AUTH_STATS_MAX_BUCKETS))
+    end = int(now or time.time()) // step * step + step
+    return end - buckets * step, end
+
+
+class AuthStats:
+    def __init__(self):
+        self.cache = CacheManager()
+        self._db = None
+        self._compaction_thread = None
+        self._compaction_lock = threading.Lock()
+        self._stop_compaction = threading.Event()
+
+    @property
+    def db(self):
+        if self._db is None:
+            from utils.db_utils import DatabaseManager
+            self._db = DatabaseManager()
+        return self._db
+
+    def record(self, auth_type: str, success: bool, failure_reason: Optional[str] = None,
+               timestamp: Optional[float] = None, user_id: Optional[int] = None) -> None:
+        """
+        Count one authentication attempt
+
+        Inside a request the increments ride on the request's deferred
+        pipeline and cost no extra round trip.
+
+        Args:
+            auth_type: face, voice or multi-factor
+            success: Whether the attempt succeeded
+            failure_reason: Reason reported to the client on failure;
+                counted by its failure_code()
+            timestamp: Event time; defaults to now
+            user_id: User the attempt was for, if known
+        """
+        reason = '' if success else failure_code(failure_reason)
+        field = _field(auth_type, success, reason)
+        now = int(timestamp or time.time())
+
+        pipe = self.cache.deferred()
+        immediate = pipe is None
+        if immediate:
+            pipe = self.cache.raw_client.pipeline(transaction=False)
+        for granularity, step in GRANULARITIES.items():
+            start = now // step * step
+            key = _bucket_key(granularity, start)
+            pipe.hincrby(key, field, 1)
+            pipe.expire(key, REDIS_TTL[granularity])
+            pipe.zadd(PENDING_KEY, {f"{granularity}:{start}": start}, nx=True)
+        if user_id is not None:
+            start = now // BUCKET_SECONDS[USER_BUCKETS] * BUCKET_SECONDS[USER_BUCKETS]
+            key, members = _user_key(start, user_id), _bucket_key(USER_BUCKETS, start)
+            pipe.hincrby(key, field, 1)
+            pipe.expire(key, REDIS_TTL[USER_BUCKETS])
+            pipe.sadd(members, user_id)
+            pipe.expire(members, REDIS_TTL[USER_BUCKETS])
+            pipe.zadd(PENDING_KEY, {f"{USER_BUCKETS}:{start}": start}, nx=True)
+        if immediate:
+            try:
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"Failed to record authentication stats: {str(e)}")
+
+        if Config.AUTH_STATS_COMPACTION_INTERVAL > 0:
+            self.start_background_compaction()
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """
+        Copy closed Redis buckets into auth_stats_rollups and auth_user_activity
+
+        Rows are set to the bucket totals held in Redis, so re-running a
+        compaction, or compacting a bucket again after a late increment,
+        is safe. A Redis lock keeps concurrent processes from racing.
+
+        Returns:
+            int: Number of buckets compacted
+        """
+        now = int(now or time.time())
+        client = self.cache.raw_client
+        token = uuid.uuid4().hex
+        if not client.set(LOCK_KEY, token, nx=True, ex=300):
+            return 0
+        try:
+            closed = []
+            for member in client.zrangebyscore(PENDING_KEY, '-inf', now - COMPACTION_GRACE):
+                granularity, start = member.decode().split(':')
+                start = int(start)
+                if start + BUCKET_SECONDS[granularity] + COMPACTION_GRACE <= now:
+                    closed.append((member, granularity, start))
+            if not closed:
+                return 0
+
+            pipe = client.pipeline(transaction=False)
+            for _, granularity, start in closed:
+                if granularity == USER_BUCKETS:
+                    pipe.smembers(_bucket_key(granularity, start))
+                else:
+                    pipe.hgetall(_bucket_key(granularity, start))
+            bucket_contents = pipe.execute()
+
+            with self.db.get_session() as session:
+                for (_, granularity, start), contents in zip(closed, bucket_contents):
+                    if not contents:
+                        logger.warning(f"Auth stats bucket {granularity}:{start} expired before compaction")
+                    elif granularity == USER_BUCKETS:
+                        self._upsert_user_bucket(session, client, start, contents)
+                    else:
+                        self._upsert_bucket(session, granularity, start, contents)
+                self._apply_retention(session, now)
+
+            client.zrem(PENDING_KEY, *[member for member, _, _ in closed])
+            logger.info(f"Compacted {len(closed)} authentication stats buckets")
+            return len(closed)
+        finally:
+            if client.get(LOCK_KEY) == token.encode():
+                client.delete(LOCK_KEY)
+
+    @staticmethod
+    def _upsert_bucket(session, granularity: str, start: int, counts: Dict[bytes, bytes]) -> None:
+        bucket_start = _to_datetime(start)
+        existing = {
+            (row.auth_type, row.success, row.failure_reason): row
+            for row in session.query(AuthStatsRollup).filter(
+                AuthStatsRollup.granularity == granularity,
+                AuthStatsRollup.bucket_start == bucket_start)
+        }
+        for field, count in counts.items():
+            key = _parse_field(field)
+            row = existing.get(key)
+            if row is not None:
+                row.count = int(count)
+            else:
+                session.add(AuthStatsRollup(
+                    granularity=granularity, bucket_start=bucket_start, auth_type=key[0],
+                    success=key[1], failure_reason=key[2], count=int(count)))
+
+    @staticmethod
+    def _upsert_user_bucket(session, client, start: int, user_ids) -> None:
+        user_ids = sorted(int(user_id) for user_id in user_ids)
+        pipe = client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(_user_key(start, user_id))
+        bucket_start = _to_datetime(start)
+        existing = {
+            (row.user_id, row.auth_type, row.success, row.failure_reason): row
+            for row in session.query(AuthUserActivity).filter(
+                AuthUserActivity.bucket_start == bucket_start)
+        }
+        for user_id, counts in zip(user_ids, pipe.execute()):
+            for field, count in counts.items():
+                key = (user_id,) + _parse_field(field)
+                row = existing.get(key)
+                if row is not None:
+                    row.count = int(count)
+                else:
+                    session.add(AuthUserActivity(
+                        user_id=user_id, bucket_start=bucket_start, auth_type=key[1],
+                        success=key[2], failure_reason=key[3], count=int(count)))
+
+    @staticmethod
+    def _apply_retention(session, now: int) -> None:
+        retention = {'minute': Config.AUTH_STATS_MINUTE_RETENTION_DAYS,
+                     'hour': Config.AUTH_STATS_HOUR_RETENTION_DAYS}
+        for granularity, days in retention.items():
+            cutoff = _to_datetime(now) - timedelta(days=days)
+            session.query(AuthStatsRollup).filter(
+                AuthStatsRollup.granularity == granularity,
+                AuthStatsRollup.bucket_start < cutoff).delete(synchronize_session=False)
+        cutoff = _to_datetime(now) - timedelta(days=Config.AUTH_STATS_USER_RETENTION_DAYS)
+        session.query(AuthUserActivity).filter(
+            AuthUserActivity.bucket_start < cutoff).delete(synchronize_session=False)
+
+    def _pending_counts(self, kind: str, start: int, end: int, key) -> Dict[int, Counter]:
+        """
+        Counts of buckets of ``kind`` in [start, end) still pending compaction
+
+        Redis holds the full totals of pending buckets, so they replace any
+        earlier compaction of the same bucket. ``key`` maps a bucket start
+        to its Redis hash.
+        """
+        counts: Dict[int, Counter] = {}
+        client = self.cache.raw_client
+        try:
+            pending = [int(member.decode().split(':')[1])
+                       for member in client.zrangebyscore(PENDING_KEY, start, end - 1)
+                       if member.decode().startswith(f"{kind}:")]
+            pipe = client.pipeline(transaction=False)
+            for bucket_start in pending:
+                pipe.hgetall(key(bucket_start))
+            for bucket_start, fields in zip(pending, pipe.execute()):
+                if fields:
+                    counts[bucket_start] = Counter(
+                        {_parse_field(f): int(c) for f, c in fields.items()})
+        except redis.RedisError as e:
+            logger.error(f"Failed to read pending authentication stats: {str(e)}")
+        return counts
+
+    def query(self, granularity: str = 'hour', buckets: int = 24,
+              now: Optional[float] = None) -> dict:
+        """
+        Success and failure counts for the most recent buckets
+
+        Compacted buckets come from auth_stats_rollups, buckets still
+        pending compaction (including the open one) from Redis.
+
+        Args:
+            granularity: minute or hour
+            buckets: Number of buckets, capped at AUTH_STATS_MAX_BUCKETS
+            now: End of the window; defaults to now
+
+        Returns:
+            dict: Per-bucket series, totals by auth_type and failure reasons
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}'")
+        step = GRANULARITIES[granularity]
+        start, end = _window(step, buckets, now)
+
+        counts: Dict[int, Counter] = {}
+        with self.db.get_session() as session:
+            rows = session.query(AuthStatsRollup).filter(
+                AuthStatsRollup.granularity == granularity,
+                AuthStatsRollup.bucket_start >= _to_datetime(start),
+                AuthStatsRollup.bucket_start < _to_datetime(end))
+            for row in rows:
+                bucket = counts.setdefault(_to_epoch(row.bucket_start), Counter())
+                bucket[(row.auth_type, row.success, row.failure_reason)] = row.count
+
+        counts.update(self._pending_counts(
+            granularity, start, end, lambda bucket_start: _bucket_key(granularity, bucket_start)))
+        return self._summarize(granularity, start, end, step, counts)
+
+    def user_activity(self, user_id: int, buckets: int = 24, now: Optional[float] = None) -> dict:
+        """
+        Hourly success and failure counts for one user
+
+        Reads the user's rows of auth_user_activity (by the unique index,
+        which leads with user_id and bucket_start) and their pending hours
+        from Redis.
+
+        Args:
+            user_id: User to report on
+            buckets: Number of hours, capped at AUTH_STATS_MAX_BUCKETS
+            now: End of the window; defaults to now
+
+        Returns:
+            dict: Same shape as query(), plus user_id
+        """
+        step = BUCKET_SECONDS[USER_BUCKETS]
+        start, end = _window(step, buckets, now)
+
+        counts: Dict[int, Counter] = {}
+        with self.db.get_session() as session:
+            rows = session.query(AuthUserActivity).filter(
+                AuthUserActivity.user_id == user_id,
+                AuthUserActivity.bucket_start >= _to_datetime(start),
+                AuthUserActivity.bucket_start < _to_datetime(end))
+            for row in rows:
+                bucket = counts.setdefault(_to_epoch(row.bucket_start), Counter())
+                bucket[(row.auth_type, row.success, row.failure_reason)] = row.count
+
+        counts.update(self._pending_counts(
+            USER_BUCKETS, start, end, lambda bucket_start: _user_key(bucket_start, user_id)))
+        result = self._summarize('hour', start, end, step, counts)
+        result['user_id'] = user_id
+        return result
+
+    @staticmethod
+    def _summarize(granularity: str, start: int, end: int, step: int,
+                   counts: Dict[int, Counter]) -> dict:
+        series: List[dict] = []
+        by_auth_type: Dict[str, Counter] = {}
+        failure_reasons = Counter()
+        for bucket_start in range(start, end, step):
+            successes = failures = 0
+            for (auth_type, success, reason), count in counts.get(bucket_start, {}).items():
+                by_auth_type.setdefault(auth_type, Counter())['success' if success else 'failure'] += count
+                if success:
+                    successes += count
+                else:
+                    failures += count
+                    failure_reasons[reason] += count
+            series.append({'bucket': _to_datetime(bucket_start).isoformat(),
+                           'success': successes, 'failure': failures})
+
+        total_success = sum(point['success'] for point in series)
+        total = total_success + sum(point['failure'] for point in series)
+        return {
+            'granularity': granularity,
+            'from': _to_datetime(start).isoformat(),
+            'to': _to_datetime(end).isoformat(),
+            'total': total,
+            'success_rate': round(total_success / total, 4) if total else None,
+            'series': series,
+            'by_auth_type': {name: dict(c) for name, c in by_auth_type.items()},
+            'failure_reasons': dict(failure_reasons.most_common()),
+        }
+
+    def start_background_compaction(self, interval: int = Config.AUTH_STATS_COMPACTION_INTERVAL) -> None:
+        """Compact closed buckets periodically from a daemon thread"""
+        if self._compaction_thread is not None:
+            return
+
+        def run():
+            while not self._stop_compaction.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Authentication stats compaction failed: {str(e)}")
+
+        # record() calls this from every request thread
+        with self._compaction_lock:
+            if self._compaction_thread is not None:
+                return
+            self._compaction_thread = threading.Thread(
+                target=run, name='auth-stats-compaction', daemon=True)
+            self._compaction_thread.start()
+
+    def stop_background_compaction(self) -> None:
+        with self._compaction_lock:
+            if self._compaction_thread is None:
+                return
+            self._stop_compaction.set()
+            self._compaction_thread.join()
+            self._compaction_thread = None
+            self._stop_compaction.clear()
+
+
+_auth_stats = None
+_auth_stats_lock = threading.Lock()
+
+
+def get_auth_stats() -> AuthStats:
+    """Process-wide AuthStats; its compaction thread starts on the first event"""
+    global _auth_stats
+    if _auth_stats is None:
+        with _auth_stats_lock:
+            if _auth_stats is None:
+                _auth_stats = AuthStats()
+    return _auth_stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ('compact', 'show', 'user') or (argv[0] == 'user' and len(argv) < 2):
+        print("usage: python -m utils.auth_stats "
+              "{compact|show [minute|hour] [BUCKETS]|user USER_ID [HOURS]}")
+        return 2
+
+    logging.basicConfig(level=logging.INFO)
+    stats = get_auth_stats()
+    if argv[0] == 'compact':
+        print(f"Compacted {stats.compact()} buckets")
+    elif argv[0] == 'user':
+        hours = int(argv[2]) if len(argv) > 2 else 24
+        print(json.dumps(stats.user_activity(int(argv[1]), hours), indent=2))
+    else:
+        granularity = argv[1] if len(argv) > 1 else 'hour'
+        buckets = int(argv[2]) if len(argv) > 2 else 24
+        print(json.dumps(stats.query(granularity, buckets), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
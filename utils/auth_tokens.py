@@ -0,0 +1,225 @@
+import hmac
+import jwt
+import redis
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from config.config import Config
+from utils.cache_manager import CacheManager
+
+STATUS_CACHE_MAX_ENTRIES = 10000
+ADMIN_HEADER = 'X-Admin-Token'
+
+
+def is_admin_request(headers) -> bool:
+    """True if the request carries the configured ADMIN_TOKEN"""
+    supplied = headers.get(ADMIN_HEADER)
+    return bool(Config.ADMIN_TOKEN) and supplied is not None and \
+        hmac.compare_digest(supplied.encode(), Config.ADMIN_TOKEN.encode())
+
+
+class CurrentUser:
+    """
+    Request user built from token claims
+
+    ``id`` and ``username`` come straight from the token. Any other
+    attribute loads the User row on first access, so handlers that only
+    need the id never touch the database.
+    """
+
+    def __init__(self, claims: Dict[str, Any]):
+        self.claims = claims
+        self.id = claims['user_id']
+        self.username = claims.get('username')
+        self._user = None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._user is None:
+            from models.models import User
+            self._user = User.query.get(self.id)
+            if self._user is None:
+                raise AttributeError(f"User {self.id} no longer exists")
+        return getattr(self._user, name)
+
+
+class TokenManager:
+    """
+    Issue and validate JWTs without a database round trip
+
+    Revocations and account locks are written to Redis. Each process caches
+    the answer for a token id or user for TOKEN_STATUS_CACHE_TTL seconds,
+    so repeat requests cost no network call and a first request costs one
+    O(log n) lookup; changes made in this process take effect immediately,
+    changes from other processes within the TTL.
+    """
+    _instance = None
+
+    REVOKED_KEY = 'revoked_tokens'
+    STATUS_KEY = 'user_status:{user_id}'
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TokenManager, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.redis_client = CacheManager().redis_client
+        self.ttl = Config.TOKEN_STATUS_CACHE_TTL
+        self._lock = threading.Lock()
+        # jti -> exp of tokens revoked by this process, honoured even if
+        # their Redis write failed
+        self._revoked_local: Dict[str, float] = {}
+        # jti -> (fetched_at, revoked) answers from Redis
+        self._revocation_cache: Dict[str, Tuple[float, bool]] = {}
+        self._status: Dict[int, Tuple[float, float, bool]] = {}
+
+    def issue(self, user) -> str:
+        """
+        Create a signed token carrying the claims handlers need
+
+        Args:
+            user: Authenticated User
+
+        Returns:
+            str: Encoded JWT
+        """
+        now = datetime.utcnow()
+        return jwt.encode({
+            'user_id': user.id,
+            'username': user.username,
+            'jti': uuid.uuid4().hex,
+            'iat': now,
+            'exp': now + timedelta(hours=Config.TOKEN_EXPIRY_HOURS)
+        }, Config.SECRET_KEY, algorithm="HS256")
+
+    def validate(self, token: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        Verify signature, expiry, revocation and account status
+
+        Args:
+            token: Encoded JWT, optionally prefixed with "Bearer "
+
+        Returns:
+            Tuple[Optional[dict], str]: (claims, "") if valid, else (None, reason)
+        """
+        if token.startswith('Bearer '):
+            token = token[7:]
+        try:
+            claims = jwt.decode(token, Config.SECRET_KEY, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return None, 'Token is invalid'
+        if 'user_id' not in claims:
+            return None, 'Token is invalid'
+
+        if self._is_revoked(claims.get('jti')):
+            return None, 'Token has been revoked'
+
+        locked_until, is_active = self._user_status(claims['user_id'])
+        if not is_active:
+            return None, 'Account is disabled'
+        if locked_until > time.time():
+            return None, 'Account is locked'
+
+        return claims, ''
+
+    def revoke(self, claims: Dict[str, Any]) -> None:
+        """Revoke a token until its expiry"""
+        jti = claims.get('jti')
+        if not jti:
+            return
+        with self._lock:
+            if len(self._revoked_local) >= STATUS_CACHE_MAX_ENTRIES:
+                self._prune_revoked_local()
+            self._revoked_local[jti] = claims.get('exp', time.time())
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.zadd(self.REVOKED_KEY, {jti: claims.get('exp', time.time())})
+            # Expired tokens fail signature validation anyway; drop them so
+            # the set only holds tokens that are still live
+            pipe.zremrangebyscore(self.REVOKED_KEY, '-inf', time.time())
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def lock_user(self, user_id: int, until: datetime) -> None:
+        """Reject the user's tokens until the given UTC time"""
+        self._set_status(user_id, locked_until=(until - datetime(1970, 1, 1)).total_seconds())
+
+    def unlock_user(self, user_id: int) -> None:
+        self._set_status(user_id, locked_until=0.0)
+
+    def set_active(self, user_id: int, is_active: bool) -> None:
+        self._set_status(user_id, is_active=is_active)
+
+    def _set_status(self, user_id: int, locked_until: Optional[float] = None,
+                    is_active: Optional[bool] = None) -> None:
+        fields = {}
+        if locked_until is not None:
+            fields['locked_until'] = locked_until
+        if is_active is not None:
+            fields['is_active'] = int(is_active)
+        with self._lock:
+            self._status.pop(user_id, None)
+        try:
+            self.redis_client.hset(self.STATUS_KEY.format(user_id=user_id), mapping=fields)
+        except redis.RedisError:
+            pass
+
+    def _is_revoked(self, jti: Optional[str]) -> bool:
+        """One ZSCORE per token per TTL, instead of fetching the whole set"""
+        if not jti:
+            return False
+        if jti in self._revoked_local:
+            return True
+        now = time.monotonic()
+        cached = self._revocation_cache.get(jti)
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1]
+        try:
+            score = self.redis_client.zscore(self.REVOKED_KEY, jti)
+        except redis.RedisError:
+            return cached[1] if cached is not None else False
+        revoked = score is not None and score > time.time()
+        with self._lock:
+            if len(self._revocation_cache) >= STATUS_CACHE_MAX_ENTRIES:
+                self._revocation_cache = {key: entry for key, entry in self._revocation_cache.items()
+                                          if now - entry[0] < self.ttl}
+            self._revocation_cache[jti] = (now, revoked)
+        return revoked
+
+    def _prune_revoked_local(self) -> None:
+        """
+        Drop expired local revocations; called under the lock when full
+
+        If every entry is still live, the half expiring soonest is dropped.
+        Those tokens stay revoked through Redis; only a revocation whose
+        Redis write also failed is lost early.
+        """
+        now = time.time()
+        live = {jti: exp for jti, exp in self._revoked_local.items() if exp > now}
+        if len(live) >= STATUS_CACHE_MAX_ENTRIES:
+            keep = sorted(live.items(), key=lambda item: item[1])[len(live) // 2:]
+            live = dict(keep)
+        self._revoked_local = live
+
+    def _user_status(self, user_id: int) -> Tuple[float, bool]:
+        now = time.monotonic()
+        cached = self._status.get(user_id)
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1], cached[2]
+        try:
+            status = self.redis_client.hgetall(self.STATUS_KEY.format(user_id=user_id))
+        except redis.RedisError:
+            status = {}
+        locked_until = float(status.get('locked_until', 0))
+        is_active = status.get('is_active', '1') != '0'
+        with self._lock:
+            if len(self._status) >= STATUS_CACHE_MAX_ENTRIES:
+                self._status = {uid: entry for uid, entry in self._status.items()
+                                if now - entry[0] < self.ttl}
+            self._status[user_id] = (now, locked_until, is_active)
+        return locked_until, is_active
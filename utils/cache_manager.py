@@ -1,8 +1,30 @@
+import json
+import time
 import redis
-from typing import Optional, Any
+from flask import g, has_request_context
+from typing import Optional, Any, List, Tuple
 from datetime import timedelta
 from config.config import RedisConfig
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def pack(value: Any) -> bytes:
+    """Serialize a value compactly (msgpack when available, JSON otherwise)"""
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def unpack(data: bytes) -> Any:
+    """Deserialize a value written by pack()"""
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
 class CacheManager:
     _instance = None
     
@@ -20,6 +42,12 @@ class CacheManager:
             password=RedisConfig.REDIS_PASSWORD,
             decode_responses=True
         )
+        # Binary-safe client for packed values such as sessions
+        self.raw_client = redis.Redis(
+            host=RedisConfig.REDIS_HOST,
+            port=RedisConfig.REDIS_PORT,
+            password=RedisConfig.REDIS_PASSWORD
+        )
 
     def set(self, key: str, value: Any, expiry: Optional[int] = None) -> bool:
         """
@@ -98,7 +126,86 @@ class CacheManager:
         count = self.get(key)
         return int(count) if count else 0
 
-    def set_session(self, session_id: str, user_data: dict, expiry: int = 3600) -> bool:
+    def deferred(self) -> Optional[redis.client.Pipeline]:
+        """
+        Get the current request's pipeline for writes that can wait
+
+        Commands queued here are sent in one round trip together with the
+        session write at the end of the request (see flush_deferred).
+
+        Returns:
+            Optional[Pipeline]: Request pipeline, or None outside a request
+        """
+        if not has_request_context():
+            return None
+        pipe = g.get('_cache_pipeline')
+        if pipe is None:
+            pipe = self.raw_client.pipeline(transaction=False)
+            g._cache_pipeline = pipe
+        return pipe
+
+    def flush_deferred(self) -> bool:
+        """
+        Send all commands queued on the request pipeline
+
+        Returns:
+            bool: Success status
+        """
+        if not has_request_context():
+            return True
+        pipe = g.pop('_cache_pipeline', None)
+        if pipe is None or not len(pipe):
+            return True
+        try:
+            pipe.execute()
+            return True
+        except redis.RedisError:
+            return False
+
+    def incr(self, key: str) -> Optional[int]:
+        """
+        Increment a counter
+
+        Returns:
+            Optional[int]: New value, or None on error
+        """
+        try:
+            return self.redis_client.incr(key)
+        except redis.RedisError:
+            return None
+
+    def expire(self, key: str, expiry: int) -> bool:
+        """Set a key's expiry"""
+        try:
+            return bool(self.redis_client.expire(key, expiry))
+        except redis.RedisError:
+            return False
+
+    def hit(self, key: str, period: int) -> Optional[int]:
+        """
+        Count one event in a fixed window, synchronously
+
+        Creates the counter with its expiry and increments it in one round
+        trip, so concurrent requests each see their own count. Never
+        deferred: a limit checked against queued increments does not hold.
+
+        Args:
+            key: Counter key
+            period: Window length in seconds
+
+        Returns:
+            Optional[int]: Count including this event, or None on error
+        """
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(key, 0, ex=period, nx=True)
+            pipe.incr(key)
+            return pipe.execute()[1]
+        except redis.RedisError:
+            return None
+
+    def set_session(self, session_id: str, user_data: dict, expiry: int = 3600,
+                    deferred: bool = False) -> bool:
         """
         Store session data with expiry
         
@@ -106,14 +213,22 @@ class CacheManager:
             session_id: Session identifier
             user_data: User session data
             expiry: Session expiry in seconds
+            deferred: Queue the write on the request pipeline
             
         Returns:
             bool: Success status
         """
         key = f"session:{session_id}"
-        return self.set(key, str(user_data), expiry)
+        pipe = self.deferred() if deferred else None
+        if pipe is not None:
+            pipe.setex(key, expiry, pack(user_data))
+            return True
+        try:
+            return bool(self.raw_client.setex(key, expiry, pack(user_data)))
+        except redis.RedisError:
+            return False
 
-    def get_session(self, session_id: str) -> Optional[str]:
+    def get_session(self, session_id: str) -> Optional[dict]:
         """
         Retrieve session data
         
@@ -121,24 +236,111 @@ class CacheManager:
             session_id: Session identifier
             
         Returns:
-            Optional[str]: Session data if exists
+            Optional[dict]: Session data if exists
+        """
+        return self.load_session(session_id)[0]
+
+    def load_session(self, session_id: str) -> Tuple[Optional[dict], Optional[int]]:
+        """
+        Retrieve session data and its remaining lifetime in one round trip
+        
+        Args:
+            session_id: Session identifier
+            
+        Returns:
+            Tuple[Optional[dict], Optional[int]]: (session data, TTL in seconds)
+        """
+        key = f"session:{session_id}"
+        try:
+            data, ttl = self.raw_client.pipeline(transaction=False).get(key).ttl(key).execute()
+        except redis.RedisError:
+            return None, None
+        if data is None:
+            return None, None
+        try:
+            return unpack(data), ttl
+        except ValueError:
+            return None, None
+
+    def touch_session(self, session_id: str, expiry: int, deferred: bool = False) -> bool:
+        """
+        Extend a session's expiry without rewriting it
+        
+        Args:
+            session_id: Session identifier
+            expiry: New expiry in seconds
+            deferred: Queue the write on the request pipeline
+            
+        Returns:
+            bool: Success status
         """
         key = f"session:{session_id}"
-        return self.get(key)
+        pipe = self.deferred() if deferred else None
+        if pipe is not None:
+            pipe.expire(key, expiry)
+            return True
+        try:
+            return bool(self.raw_client.expire(key, expiry))
+        except redis.RedisError:
+            return False
 
-    def invalidate_session(self, session_id: str) -> bool:
+    def invalidate_session(self, session_id: str, deferred: bool = False) -> bool:
         """
         Invalidate a session
         
         Args:
             session_id: Session identifier
+            deferred: Queue the delete on the request pipeline
             
         Returns:
             bool: Success status
         """
         key = f"session:{session_id}"
+        pipe = self.deferred() if deferred else None
+        if pipe is not None:
+            pipe.delete(key)
+            return True
         return self.delete(key)
 
+    def store_profile(self, request_id: str, profile: dict, expiry: int = 3600) -> bool:
+        """
+        Store a request profile and index it by capture time
+
+        Args:
+            request_id: Request identifier
+            profile: Collapsed stacks and wall-time breakdown
+            expiry: Retention in seconds
+
+        Returns:
+            bool: Success status
+        """
+        now = time.time()
+        try:
+            pipe = self.raw_client.pipeline(transaction=False)
+            pipe.setex(f"profile:{request_id}", expiry, pack(profile))
+            pipe.zadd('profiles', {request_id: now})
+            pipe.zremrangebyscore('profiles', '-inf', now - expiry)
+            pipe.execute()
+            return True
+        except redis.RedisError:
+            return False
+
+    def get_profile(self, request_id: str) -> Optional[dict]:
+        """Get a stored request profile"""
+        try:
+            data = self.raw_client.get(f"profile:{request_id}")
+        except redis.RedisError:
+            return None
+        return unpack(data) if data else None
+
+    def list_profiles(self, limit: int = 50) -> List[Tuple[str, float]]:
+        """Most recent profiled request ids with their capture times"""
+        try:
+            entries = self.raw_client.zrevrange('profiles', 0, limit - 1, withscores=True)
+        except redis.RedisError:
+            return []
+        return [(request_id.decode(), score) for request_id, score in entries]
+
     def store_biometric_temp(self, user_id: str, biometric_data: str, 
                            expiry: int = 300) -> bool:
         """
@@ -159,5 +361,6 @@ class CacheManager:
         """Close Redis connection"""
         try:
             self.redis_client.close()
+            self.raw_client.close()
         except redis.RedisError:
             pass
@@ -0,0 +1,212 @@
+import cProfile
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from flask import Flask, g, request
+
+from config.config import Config
+from utils.auth_tokens import is_admin_request
+from utils.cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+# Admins send this header (with X-Admin-Token) to profile a single request
+PROFILE_HEADER = 'X-Profile'
+REQUEST_ID_HEADER = 'X-Request-Id'
+BREAKDOWN_ROWS = 30
+
+# cProfile hooks are process-wide on newer interpreters, so at most one
+# request is traced at a time; others fall back to sampling
+_cprofile_lock = threading.Lock()
+
+
+def _label(code) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}.{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Sample one thread's stack from a background thread
+
+    The profiled thread runs untouched; every ``interval`` seconds the
+    sampler reads its current frame and records the stack, weighted by the
+    wall time actually elapsed since the previous sample.
+    """
+
+    def __init__(self, thread_id: int, interval: float = Config.PROFILING_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.weights: Dict[Tuple[str, ...], float] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            stack = tuple(reversed(stack))
+            self.samples[stack] += 1
+            self.weights[stack] += now - last
+            last = now
+
+    def collapsed(self) -> List[str]:
+        return [f"{';'.join(stack)} {count}" for stack, count in self.samples.most_common()]
+
+    def breakdown(self) -> List[dict]:
+        inclusive, exclusive = Counter(), Counter()
+        for stack, seconds in self.weights.items():
+            for name in set(stack):
+                inclusive[name] += seconds
+            exclusive[stack[-1]] += seconds
+        return [{'function': name, 'inclusive_ms': round(seconds * 1000, 2),
+                 'self_ms': round(exclusive[name] * 1000, 2)}
+                for name, seconds in inclusive.most_common(BREAKDOWN_ROWS)]
+
+
+class DeterministicProfiler:
+    """cProfile wrapper producing the same output shape as SamplingProfiler"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.stats = {}
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+        self.stats = pstats.Stats(self.profile).stats
+
+    @staticmethod
+    def _name(key: tuple) -> str:
+        filename, _, function = key
+        if filename == '~':
+            return function  # built-in, e.g. "<built-in method builtins.sum>"
+        return f"{os.path.splitext(os.path.basename(filename))[0]}.{function}"
+
+    def collapsed(self) -> List[str]:
+        # cProfile records caller/callee pairs, not full stacks; weights are
+        # microseconds of the callee's own time under that caller
+        lines = []
+        for key, (_, _, _, _, callers) in self.stats.items():
+            for caller, (_, _, own_time, _) in callers.items():
+                micros = int(own_time * 1e6)
+                if micros:
+                    lines.append(f"{self._name(caller)};{self._name(key)} {micros}")
+        return lines
+
+    def breakdown(self) -> List[dict]:
+        rows = sorted(self.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [{'function': self._name(key), 'calls': calls,
+                 'inclusive_ms': round(cumulative * 1000, 2), 'self_ms': round(own * 1000, 2)}
+                for key, (_, calls, own, cumulative, _) in rows[:BREAKDOWN_ROWS]]
+
+
+def _should_profile() -> bool:
+    if PROFILE_HEADER in request.headers and is_admin_request(request.headers):
+        return True
+    rate = Config.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile() -> None:
+    if not _should_profile():
+        return
+    profiler = None
+    if Config.PROFILING_MODE == 'cprofile' and _cprofile_lock.acquire(blocking=False):
+        profiler = DeterministicProfiler()
+        try:
+            profiler.start()
+        except ValueError:
+            # Another profiler is already active in this process
+            _cprofile_lock.release()
+            profiler = None
+    if profiler is None:
+        profiler = SamplingProfiler(threading.get_ident())
+        profiler.start()
+
+    g._profile = {
+        'profiler': profiler,
+        # Profiles are stored under this id, so it never comes from the client
+        'request_id': uuid.uuid4().hex,
+        'client_request_id': request.headers.get(REQUEST_ID_HEADER, '')[:128] or None,
+        'started_at': time.time(),
+        'start': time.perf_counter(),
+    }
+
+
+def _tag_response(response):
+    profile = g.get('_profile')
+    if profile is not None:
+        profile['status'] = response.status_code
+        response.headers[REQUEST_ID_HEADER] = profile['request_id']
+    return response
+
+
+def _finish_profile(exc) -> None:
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return
+    wall = time.perf_counter() - profile['start']
+    profiler = profile['profiler']
+    profiler.stop()
+    if isinstance(profiler, DeterministicProfiler):
+        _cprofile_lock.release()
+
+    record = {
+        'request_id': profile['request_id'],
+        'client_request_id': profile['client_request_id'],
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': profile.get('status', 500),
+        'mode': 'cprofile' if isinstance(profiler, DeterministicProfiler) else 'sampling',
+        'started_at': profile['started_at'],
+        'wall_ms': round(wall * 1000, 2),
+        'breakdown': profiler.breakdown(),
+        'collapsed': profiler.collapsed(),
+    }
+    if not CacheManager().store_profile(record['request_id'], record, Config.PROFILING_RETENTION):
+        logger.warning(f"Failed to store profile for request {record['request_id']}")
+
+
+def init_app(app: Flask) -> None:
+    """
+    Install the profiling hooks
+
+    Nothing is registered unless PROFILING_SAMPLE_RATE > 0 or an
+    ADMIN_TOKEN is configured, so with profiling off requests run exactly
+    as before. Profiles are stored under a server-generated request id,
+    returned in the X-Request-Id response header; an X-Request-Id sent by
+    the client is only kept in the record for correlation.
+    """
+    if Config.PROFILING_SAMPLE_RATE <= 0 and not Config.ADMIN_TOKEN:
+        return
+    # Registered before the blueprints' hooks so the whole request is covered
+    app.before_request(_start_profile)
+    app.after_request(_tag_response)
+    app.teardown_request(_finish_profile)
@@ -0,0 +1,89 @@
+import secrets
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from config.config import Config
+from utils.cache_manager import CacheManager
+
+
+class RedisSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, ttl=None):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.ttl = ttl
+        self.modified = False
+        # Identity the session was loaded with; a change means it was
+        # elevated (or switched user) and needs a fresh id
+        self.loaded_user_id = self.get('user_id')
+        self.replaced_sid = None
+
+    def regenerate(self) -> None:
+        """Move the session to a new id, dropping the old one on save"""
+        if not self.new and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class RedisSessionInterface(SessionInterface):
+    """
+    Server-side Flask sessions stored in Redis through CacheManager
+
+    The cookie only carries a random session id. Session data is packed
+    compactly and rewritten only when it changes; otherwise the expiry is
+    slid forward only once less than ``timeout - refresh_threshold``
+    seconds remain, so most requests do not write at all. Any writes are
+    sent in the same round trip as other deferred per-request commands.
+
+    When ``user_id`` changes (typically on login) the session gets a new
+    id, so an id planted before authentication is never elevated.
+    """
+
+    def __init__(self, cache: CacheManager = None,
+                 timeout: int = Config.SESSION_TIMEOUT,
+                 refresh_threshold: int = Config.SESSION_REFRESH_THRESHOLD):
+        self.cache = cache or CacheManager()
+        self.timeout = timeout
+        self.refresh_threshold = refresh_threshold
+
+    def open_session(self, app, request) -> RedisSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data, ttl = self.cache.load_session(sid)
+            if data is not None:
+                return RedisSession(data, sid=sid, ttl=ttl)
+        return RedisSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session: RedisSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session and session.get('user_id') != session.loaded_user_id and not session.new:
+            session.regenerate()
+        if session.replaced_sid is not None:
+            self.cache.invalidate_session(session.replaced_sid, deferred=True)
+
+        if not session:
+            if session.modified and not session.new:
+                self.cache.invalidate_session(session.sid, deferred=True)
+                response.delete_cookie(name, domain=domain, path=path)
+        elif session.modified or session.new:
+            self.cache.set_session(session.sid, dict(session), self.timeout, deferred=True)
+            if session.new:
+                response.set_cookie(
+                    name, session.sid,
+                    httponly=self.get_cookie_httponly(app),
+                    secure=self.get_cookie_secure(app),
+                    samesite=self.get_cookie_samesite(app),
+                    domain=domain,
+                    path=path
+                )
+        elif session.ttl is not None and session.ttl < self.timeout - self.refresh_threshold:
+            self.cache.touch_session(session.sid, self.timeout, deferred=True)
+
+        self.cache.flush_deferred()
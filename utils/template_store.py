@@ -0,0 +1,514 @@
+"""Memory-mapped, append-only store for face templates.
+
+Layout under ``Config.TEMPLATE_STORAGE_PATH``::
+
+    CURRENT            generation number of the live file set
+    LOCK               writer lock (flock)
+    face.<gen>.meta    JSON header: template dimension and dtype
+    face.<gen>.vec     row-major matrix of templates
+    face.<gen>.ids     int64 user id per row
+    face.<gen>.tomb    int64 indices of deleted or superseded rows
+
+Rows are only ever appended; replacing or deleting a template appends
+tombstones. Writers first truncate the files back to the last complete row,
+so bytes left by a crashed append can never pair a user id with another
+user's vector. New rows are written and fsynced before the tombstones for
+the rows they replace; if a crash lands in between, the newest row for a
+user wins. Readers map the files read-only,
+which lets every worker share the same pages through the OS page cache.
+Compaction rewrites live rows into a new generation and switches CURRENT
+atomically; readers pick it up on their next refresh.
+
+Usage:
+    python -m utils.template_store rebuild
+    python -m utils.template_store compact
+    python -m utils.template_store stats
+"""
+import fcntl
+import json
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+ID_DTYPE = np.dtype('<i8')
+SEARCH_CHUNK_ROWS = 65536
+# Times refresh() follows CURRENT when compactions remove the generation it read
+REFRESH_ATTEMPTS = 5
+
+
+class _View:
+    """Immutable mapping of one generation; replaced as a whole on refresh"""
+
+    def __init__(self, generation: Optional[int], sizes: Optional[tuple],
+                 vectors: np.ndarray, ids: np.ndarray, live: np.ndarray,
+                 sorted_ids: np.ndarray, sorted_rows: np.ndarray):
+        self.generation = generation
+        self.sizes = sizes
+        self.vectors = vectors
+        self.ids = ids
+        self.live = live
+        self.sorted_ids = sorted_ids
+        self.sorted_rows = sorted_rows
+
+
+class TemplateStore:
+    def __init__(self, path: str = Config.TEMPLATE_STORAGE_PATH,
+                 dim: int = Config.FACE_TEMPLATE_DIM,
+                 dtype: str = Config.TEMPLATE_STORE_DTYPE):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.row_bytes = self.dim * self.dtype.itemsize
+
+        self._lock = threading.RLock()
+        # Readers take one reference to the current view and never touch
+        # self._view again, so a concurrent refresh cannot mix generations
+        self._view = _View(None, None, np.empty((0, self.dim), dtype=self.dtype),
+                           np.empty(0, dtype=ID_DTYPE), np.empty(0, dtype=bool),
+                           np.empty(0, dtype=ID_DTYPE), np.empty(0, dtype=np.int64))
+        self._compaction_thread = None
+        self._compaction_lock = threading.Lock()
+        self._stop_compaction = threading.Event()
+
+        os.makedirs(self.path, exist_ok=True)
+        with self._writer_lock():
+            if self._read_current() is None:
+                self._write_generation(0, np.empty((0, self.dim), dtype=self.dtype),
+                                       np.empty(0, dtype=ID_DTYPE))
+                self._set_current(0)
+
+    # ------------------------------------------------------------------
+    # File layout helpers
+    # ------------------------------------------------------------------
+
+    def _file(self, generation: int, suffix: str) -> str:
+        return os.path.join(self.path, f"face.{generation}.{suffix}")
+
+    def _read_current(self) -> Optional[int]:
+        try:
+            with open(os.path.join(self.path, 'CURRENT')) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _set_current(self, generation: int) -> None:
+        tmp_path = os.path.join(self.path, 'CURRENT.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(str(generation))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, 'CURRENT'))
+
+    def _write_generation(self, generation: int, vectors: np.ndarray,
+                          ids: np.ndarray) -> None:
+        """Write a complete file set for a generation and fsync it"""
+        with open(self._file(generation, 'meta'), 'w') as f:
+            json.dump({'dim': self.dim, 'dtype': self.dtype.name}, f)
+        for suffix, array in (('vec', vectors), ('ids', ids),
+                              ('tomb', np.empty(0, dtype=ID_DTYPE))):
+            with open(self._file(generation, suffix), 'wb') as f:
+                f.write(np.ascontiguousarray(array).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    @contextmanager
+    def _writer_lock(self) -> Iterator[None]:
+        """Serialize writers across threads and processes"""
+        with self._lock:
+            with open(os.path.join(self.path, 'LOCK'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @property
+    def _generation(self) -> Optional[int]:
+        return self._view.generation
+
+    @staticmethod
+    def _fsync_append(path: str, data: bytes) -> None:
+        with open(path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncate_torn(self, generation: int) -> int:
+        """
+        Cut every file of a generation back to its last complete row
+
+        Must be called under the writer lock.
+
+        Returns:
+            int: Number of complete rows
+        """
+        vec_path, ids_path, tomb_path = (self._file(generation, s) for s in ('vec', 'ids', 'tomb'))
+        rows = min(os.path.getsize(vec_path) // self.row_bytes,
+                   os.path.getsize(ids_path) // ID_DTYPE.itemsize)
+        for path, size in ((vec_path, rows * self.row_bytes),
+                           (ids_path, rows * ID_DTYPE.itemsize),
+                           (tomb_path, os.path.getsize(tomb_path) // ID_DTYPE.itemsize * ID_DTYPE.itemsize)):
+            if os.path.getsize(path) != size:
+                logger.warning(f"Truncating torn write in {path} to {size} bytes")
+                os.truncate(path, size)
+        return rows
+
+    @staticmethod
+    def _map(path: str, dtype: np.dtype, count: int) -> np.ndarray:
+        if count <= 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def refresh(self) -> bool:
+        """
+        Re-map the store if it was appended to or compacted
+
+        Returns:
+            bool: True if the mapped view changed
+        """
+        with self._lock:
+            for _ in range(REFRESH_ATTEMPTS):
+                generation = self._read_current()
+                if generation is None:
+                    return False
+                try:
+                    return self._remap(generation)
+                except FileNotFoundError:
+                    # A compaction removed this generation after CURRENT was
+                    # read; CURRENT already names its successor
+                    continue
+            logger.warning(f"Template store at {self.path} kept changing during refresh, "
+                           f"keeping generation {self._view.generation}")
+            return False
+
+    def _remap(self, generation: int) -> bool:
+        """Map one generation; raises FileNotFoundError if it was compacted away"""
+        # Tombstones are written after the rows replacing them, so sizing
+        # the tombstone file first never hides a user whose new row is not
+        # visible yet
+        tomb_size = os.path.getsize(self._file(generation, 'tomb'))
+        sizes = (os.path.getsize(self._file(generation, 'vec')),
+                 os.path.getsize(self._file(generation, 'ids')),
+                 tomb_size)
+        if generation == self._view.generation and sizes == self._view.sizes:
+            return False
+
+        with open(self._file(generation, 'meta')) as f:
+            meta = json.load(f)
+        if meta['dim'] != self.dim or np.dtype(meta['dtype']) != self.dtype:
+            raise ValueError(f"Template store at {self.path} holds "
+                             f"{meta['dtype']}[{meta['dim']}] templates")
+
+        rows = min(sizes[0] // self.row_bytes, sizes[1] // ID_DTYPE.itemsize)
+        vectors = self._map(self._file(generation, 'vec'), self.dtype, rows * self.dim)
+        ids = self._map(self._file(generation, 'ids'), ID_DTYPE, rows)
+        tombstones = np.fromfile(self._file(generation, 'tomb'), dtype=ID_DTYPE,
+                                 count=sizes[2] // ID_DTYPE.itemsize)
+
+        live = np.ones(rows, dtype=bool)
+        live[tombstones[(tombstones >= 0) & (tombstones < rows)]] = False
+        live_rows = np.flatnonzero(live)
+        # Stable sort keeps rows of one user in append order; if an
+        # append crashed before tombstoning the old row, the last wins
+        order = np.argsort(ids[live_rows], kind='stable')
+        sorted_rows = live_rows[order]
+        sorted_ids = np.asarray(ids[sorted_rows])
+        newest = np.ones(len(sorted_ids), dtype=bool)
+        newest[:-1] = sorted_ids[:-1] != sorted_ids[1:]
+        live[sorted_rows[~newest]] = False
+
+        self._view = _View(generation, sizes, vectors.reshape(rows, self.dim), ids, live,
+                           sorted_ids[newest], sorted_rows[newest])
+        return True
+
+    def __len__(self) -> int:
+        return len(self._view.sorted_rows)
+
+    def get(self, user_id: int) -> Optional[np.ndarray]:
+        """
+        Get the live template for a user
+
+        Args:
+            user_id: User identifier
+
+        Returns:
+            Optional[np.ndarray]: float32 template if the user is enrolled
+        """
+        view = self._view
+        index = np.searchsorted(view.sorted_ids, user_id)
+        if index >= len(view.sorted_ids) or view.sorted_ids[index] != user_id:
+            return None
+        return view.vectors[view.sorted_rows[index]].astype(np.float32)
+
+    def iter_live(self, chunk_rows: int = SEARCH_CHUNK_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yield (user_ids, float32 templates) chunks of live rows"""
+        view = self._view
+        vectors, ids, live = view.vectors, view.ids, view.live
+        for start in range(0, len(live), chunk_rows):
+            mask = live[start:start + chunk_rows]
+            if not mask.any():
+                continue
+            yield (np.asarray(ids[start:start + chunk_rows][mask]),
+                   vectors[start:start + chunk_rows][mask].astype(np.float32))
+
+    def search(self, probe: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Find the k nearest enrolled templates by euclidean distance
+
+        Args:
+            probe: Face encoding to search for
+            k: Number of results
+
+        Returns:
+            List[Tuple[int, float]]: (user_id, distance) pairs, nearest first
+        """
+        probe = np.asarray(probe, dtype=np.float32)
+        best_ids = np.empty(0, dtype=ID_DTYPE)
+        best_distances = np.empty(0, dtype=np.float32)
+
+        for ids, vectors in self.iter_live():
+            distances = np.linalg.norm(vectors - probe, axis=1)
+            best_ids = np.concatenate((best_ids, ids))
+            best_distances = np.concatenate((best_distances, distances))
+            if len(best_distances) > k:
+                keep = np.argpartition(best_distances, k)[:k]
+                best_ids, best_distances = best_ids[keep], best_distances[keep]
+
+        order = np.argsort(best_distances)[:k]
+        return [(int(best_ids[i]), float(best_distances[i])) for i in order]
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def append(self, user_ids: Iterable[int], templates: np.ndarray) -> None:
+        """
+        Append templates, superseding any existing rows for those users
+
+        Args:
+            user_ids: One user identifier per template row
+            templates: Array of shape (n, dim)
+        """
+        user_ids = np.asarray(list(user_ids), dtype=ID_DTYPE)
+        templates = np.asarray(templates, dtype=self.dtype).reshape(-1, self.dim)
+        if len(user_ids) != len(templates):
+            raise ValueError("user_ids and templates must have the same length")
+        if not len(user_ids):
+            return
+
+        with self._writer_lock():
+            self.refresh()
+            generation = self._generation
+            self._truncate_torn(generation)
+            superseded = self._live_rows_for(user_ids)
+            # New rows first: a crash before the tombstones leaves both rows,
+            # and refresh() prefers the newer one
+            self._fsync_append(self._file(generation, 'vec'), templates.tobytes())
+            self._fsync_append(self._file(generation, 'ids'), user_ids.tobytes())
+            self._append_tombstones(generation, superseded)
+            self.refresh()
+
+    def delete(self, user_ids: Iterable[int]) -> None:
+        """Tombstone all live templates for the given users"""
+        user_ids = np.asarray(list(user_ids), dtype=ID_DTYPE)
+        with self._writer_lock():
+            self.refresh()
+            self._truncate_torn(self._generation)
+            self._append_tombstones(self._generation, self._live_rows_for(user_ids))
+            self.refresh()
+
+    def _live_rows_for(self, user_ids: np.ndarray) -> np.ndarray:
+        view = self._view
+        # Includes rows already hidden by a newer duplicate so they are
+        # tombstoned for good
+        return np.flatnonzero(np.isin(view.ids, user_ids) & ~self._tombstoned(view))
+
+    def _tombstoned(self, view: _View) -> np.ndarray:
+        tombstones = np.fromfile(self._file(view.generation, 'tomb'), dtype=ID_DTYPE,
+                                 count=os.path.getsize(self._file(view.generation, 'tomb'))
+                                 // ID_DTYPE.itemsize)
+        mask = np.zeros(len(view.ids), dtype=bool)
+        mask[tombstones[(tombstones >= 0) & (tombstones < len(view.ids))]] = True
+        return mask
+
+    def _append_tombstones(self, generation: int, rows: np.ndarray) -> None:
+        if not len(rows):
+            return
+        self._fsync_append(self._file(generation, 'tomb'), np.asarray(rows, dtype=ID_DTYPE).tobytes())
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def dead_ratio(self) -> float:
+        """Fraction of stored rows that are tombstoned"""
+        view = self._view
+        total = len(view.live)
+        return 1.0 - len(view.sorted_rows) / total if total else 0.0
+
+    def compact(self) -> None:
+        """Rewrite live rows into a new generation and switch to it"""
+        with self._writer_lock():
+            self.refresh()
+            view = self._view
+            old_generation = view.generation
+            new_generation = old_generation + 1
+            rows = np.sort(view.sorted_rows)
+
+            self._write_generation(new_generation,
+                                   np.asarray(view.vectors[rows]),
+                                   np.asarray(view.ids[rows]))
+            self._set_current(new_generation)
+            self.refresh()
+
+            # Readers that still map the old files keep their pages until
+            # they refresh; unlinking does not invalidate existing mappings.
+            for suffix in ('meta', 'vec', 'ids', 'tomb'):
+                try:
+                    os.remove(self._file(old_generation, suffix))
+                except FileNotFoundError:
+                    pass
+
+        logger.info(f"Compacted template store to generation {new_generation} "
+                    f"with {len(rows)} templates")
+
+    def start_background_compaction(self, interval: int = Config.TEMPLATE_COMPACTION_INTERVAL,
+                                    min_dead_ratio: float = Config.TEMPLATE_COMPACTION_MIN_DEAD_RATIO) -> None:
+        """Compact periodically whenever enough rows are dead"""
+        if self._compaction_thread is not None:
+            return
+
+        def run():
+            while not self._stop_compaction.wait(interval):
+                try:
+                    self.refresh()
+                    if self.dead_ratio() >= min_dead_ratio:
+                        self.compact()
+                except Exception as e:
+                    logger.error(f"Template store compaction failed: {str(e)}")
+
+        with self._compaction_lock:
+            if self._compaction_thread is not None:
+                return
+            self._compaction_thread = threading.Thread(
+                target=run, name='template-store-compaction', daemon=True)
+            self._compaction_thread.start()
+
+    def stop_background_compaction(self) -> None:
+        with self._compaction_lock:
+            if self._compaction_thread is None:
+                return
+            self._stop_compaction.set()
+            self._compaction_thread.join()
+            self._compaction_thread = None
+            self._stop_compaction.clear()
+
+
+def decode_template(face_template: bytes, dim: int) -> np.ndarray:
+    """Decode a stored face template; ones written before the float32 format are float64"""
+    dtype = np.float64 if len(face_template) == dim * 8 else np.float32
+    return np.frombuffer(face_template, dtype=dtype)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_template_store() -> Optional[TemplateStore]:
+    """
+    Process-wide store when TEMPLATE_STORE_ENABLED, refreshed on every call
+
+    The first call starts background compaction unless
+    TEMPLATE_COMPACTION_INTERVAL is 0; compactions from several processes
+    are serialised by the writer lock.
+    """
+    global _store
+    if not Config.TEMPLATE_STORE_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TemplateStore()
+                if Config.TEMPLATE_COMPACTION_INTERVAL > 0:
+                    _store.start_background_compaction()
+    _store.refresh()
+    return _store
+
+
+def publish_template(user_id: int, face_template: Optional[bytes]) -> None:
+    """Append a newly committed face template so workers mapping the store see it"""
+    store = get_template_store()
+    if store is None or not face_template:
+        return
+    try:
+        store.append([user_id], decode_template(face_template, store.dim))
+    except Exception as e:
+        # The database stays authoritative; `rebuild` recovers the store
+        logger.error(f"Failed to publish template for user {user_id}: {str(e)}")
+
+
+def rebuild_from_database(store: TemplateStore, batch_size: int = 10000) -> int:
+    """
+    Load every primary face template from the database into the store
+
+    This is a one-off migration; afterwards workers only map the store.
+
+    Returns:
+        int: Number of templates written
+    """
+    from models.models import BiometricData
+    from utils.db_utils import DatabaseManager
+
+    written = 0
+    with DatabaseManager().get_session() as session:
+        query = (session.query(BiometricData.user_id, BiometricData.face_template)
+                 .filter(BiometricData.is_primary.is_(True),
+                         BiometricData.face_template.isnot(None))
+                 .yield_per(batch_size))
+        user_ids, templates = [], []
+        for user_id, face_template in query:
+            user_ids.append(user_id)
+            templates.append(decode_template(face_template, store.dim))
+            if len(user_ids) >= batch_size:
+                store.append(user_ids, np.vstack(templates))
+                written += len(user_ids)
+                user_ids, templates = [], []
+        if user_ids:
+            store.append(user_ids, np.vstack(templates))
+            written += len(user_ids)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1 or argv[0] not in ('rebuild', 'compact', 'stats'):
+        print("usage: python -m utils.template_store {rebuild|compact|stats}")
+        return 2
+
+    logging.basicConfig(level=logging.INFO)
+    store = TemplateStore()
+    store.refresh()
+    if argv[0] == 'rebuild':
+        print(f"Wrote {rebuild_from_database(store)} templates")
+    elif argv[0] == 'compact':
+        store.compact()
+    print(f"generation={store._generation} live={len(store)} "
+          f"dead_ratio={store.dead_ratio():.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())